@@ -0,0 +1,77 @@
+"""
+Connection-per-request against persistent and pooled connections on a
+local Postgres. Every simulated request runs the same cycle Django does
+(close_old_connections before and after) around a User lookup. The
+database must already be migrated.
+
+    POSTGRES_DB=creze POSTGRES_USER=postgres POSTGRES_PASSWORD=postgres \\
+        python -m benchmarks.db_pool --concurrency 16 --requests 2000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import BASE_DIR, setup_django, summarize
+
+MODES = {
+    'per_request': {'DB_CONN_MAX_AGE': '0'},
+    'persistent': {'DB_CONN_MAX_AGE': '60'},
+    'pooled': {'DB_POOL': '1'},
+}
+
+
+def run(concurrency, requests):
+    setup_django(test_db=False)
+    from django.db import close_old_connections, connection
+    from users.models import User
+
+    def request(_):
+        start = time.perf_counter()
+        close_old_connections()
+        User.objects.filter(pk=1).first()
+        close_old_connections()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        samples = list(executor.map(request, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    report = summarize(samples) | {'throughput_rps': round(requests / elapsed, 1)}
+    if connection.settings_dict['ENGINE'] == 'utils.db_pool':
+        from utils.db_pool.base import pool_metrics
+        report['pool'] = pool_metrics()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--mode', choices=MODES)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.concurrency, args.requests)))
+        return
+
+    if not os.getenv('POSTGRES_DB'):
+        sys.exit('Define POSTGRES_DB (and POSTGRES_USER, POSTGRES_PASSWORD, DB_HOST) first.')
+
+    report = {}
+    for mode, env in MODES.items():
+        output = subprocess.check_output(
+            [sys.executable, '-m', 'benchmarks.db_pool', '--mode', mode,
+             '--concurrency', str(args.concurrency), '--requests', str(args.requests)],
+            cwd=BASE_DIR, env=os.environ | env,
+        )
+        report[mode] = json.loads(output.decode().strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
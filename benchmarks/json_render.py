@@ -0,0 +1,95 @@
+"""
+Per request cost of LoginView and MFASetupView with DRF's JSONRenderer and
+JSONParser against FastJSONRenderer/FastJSONParser, with orjson and with
+the stdlib fallback. The views are called in process through
+APIRequestFactory, password hashing runs inline with a tiny scrypt cost so
+the JSON handling isn't buried under the hash, and the render and parse
+steps are also timed alone.
+
+    python -m benchmarks.json_render --iterations 5000
+"""
+import argparse
+import json
+import os
+import time
+from io import BytesIO
+from unittest.mock import patch
+
+from benchmarks.common import setup_django, summarize
+
+
+def measure(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    os.environ.setdefault('HASHING_POOL_WORKERS', '0')
+    os.environ.setdefault('SCRYPT_WORK_FACTOR', '16')
+    setup_django()
+    from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+    from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from users.models import User
+    from users.views import LoginView, MFASetupView
+    from utils import fast_json
+    from utils.fast_json import FastJSONParser, FastJSONRenderer
+
+    user = User.objects.create_user(email='bench@example.com', password='securepassword123')
+    factory = APIRequestFactory()
+    login_body = json.dumps({'email': 'bench@example.com', 'password': 'securepassword123'})
+
+    def stacks():
+        yield 'drf', JSONRenderer, JSONParser
+        yield 'fast_orjson', FastJSONRenderer, FastJSONParser
+        with patch.object(fast_json, 'orjson', None):
+            yield 'fast_stdlib', FastJSONRenderer, FastJSONParser
+
+    report = {}
+    for name, renderer_class, parser_class in stacks():
+        config = {
+            'renderer_classes': [renderer_class, BrowsableAPIRenderer],
+            'parser_classes': [parser_class, FormParser, MultiPartParser],
+        }
+        login = LoginView.as_view(**config)
+        setup = MFASetupView.as_view(**config)
+
+        def call_login():
+            request = factory.post('/api/login/', login_body, content_type='application/json',
+                                   HTTP_ACCEPT='application/json')
+            response = login(request)
+            response.render()
+            assert response.status_code == 200, response.content
+
+        def call_setup():
+            request = factory.get('/api/mfa-setup/', HTTP_ACCEPT='application/json')
+            force_authenticate(request, user)
+            response = setup(request)
+            response.render()
+            assert response.status_code == 200, response.content
+
+        renderer = renderer_class()
+        json_parser = parser_class()
+        login_data = {'token': 'x' * 200, 'otp_activated': True, 'otp_verified': False}
+        setup_data = {'otp_uri': 'otpauth://totp/CrezeApp:bench%40example.com?secret=' + 'A' * 32}
+        report[name] = {
+            'login_view': measure(call_login, args.iterations),
+            'mfa_setup_view': measure(call_setup, args.iterations),
+            'render_login': measure(lambda: renderer.render(login_data), args.iterations * 10),
+            'render_mfa_setup': measure(lambda: renderer.render(setup_data), args.iterations * 10),
+            'parse_login': measure(lambda: json_parser.parse(BytesIO(login_body.encode())), args.iterations * 10),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
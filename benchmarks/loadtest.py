@@ -0,0 +1,335 @@
+"""
+Load test of the users API against a locally started gunicorn. Every
+endpoint is driven with "--requests" requests at "--concurrency", each one
+with its own seeded user, and the report has throughput, latency
+percentiles and DB queries per request (read from /metrics).
+
+    python -m benchmarks.loadtest run --concurrency 8 --requests 200
+    python -m benchmarks.loadtest run --database postgres --output base.json
+    python -m benchmarks.loadtest compare base.json benchmarks/results/<run>.json
+
+SQLite runs on a throwaway file, "--database postgres" uses the POSTGRES_DB,
+POSTGRES_USER, POSTGRES_PASSWORD, DB_HOST and DB_PORT env variables and
+leaves the seeded users behind. "compare" exits with 1 when p95 latency or
+throughput got worse than "--tolerance" or queries per request went up.
+"""
+import argparse
+import http.client
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from benchmarks.common import BASE_DIR, setup_django, summarize
+
+PASSWORD = 'securepassword123'
+RECOVERY_CODE = 'benchcode1'
+
+WORKER_CLASSES = ('sync', 'gthread', 'gevent', 'uvicorn')
+
+ENDPOINTS = {
+    'login': ('POST', '/api/login/'),
+    'signup': ('POST', '/api/signup/'),
+    'mfa-setup': ('GET', '/api/mfa-setup/'),
+    'mfa-validate': ('POST', '/api/mfa-validate/'),
+    'mfa-disable': ('POST', '/api/mfa-disable/'),
+    'mfa-activate': ('POST', '/api/mfa-activate/'),
+}
+
+
+def seed(run_id, requests):
+    """
+    Creates "requests" users per endpoint in the state the endpoint needs
+    and returns the list of (body, token) for each one.
+    """
+    import pyotp
+    from django.contrib.auth.hashers import make_password
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from users.models import RecoveryCode, User
+
+    password = make_password(PASSWORD)
+    secret = pyotp.random_base32()
+    states = {
+        'login': {},
+        'mfa-setup': {},
+        'mfa-validate': {'otp_activated': True},
+        'mfa-disable': {'otp_activated': True, 'otp_verified': True},
+        'mfa-activate': {'otp_activated': False},
+    }
+
+    plan = {}
+    for endpoint, state in states.items():
+        users = User.objects.bulk_create(
+            User(email=f'{endpoint}-{run_id}-{i}@example.com', password=password,
+                 otp_secret=secret, **state)
+            for i in range(requests)
+        )
+        if endpoint == 'mfa-disable':
+            RecoveryCode.objects.bulk_create(
+                RecoveryCode(user=user, code_hash=RecoveryCode.hash_code(user.pk, RECOVERY_CODE))
+                for user in users
+            )
+        plan[endpoint] = [
+            (body_for(endpoint, user, secret), str(RefreshToken.for_user(user).access_token))
+            for user in users
+        ]
+
+    plan['signup'] = [
+        ({'email': f'signup-{run_id}-{i}@example.com', 'password': PASSWORD}, None)
+        for i in range(requests)
+    ]
+    return plan
+
+
+def body_for(endpoint, user, secret):
+    import pyotp
+
+    if endpoint == 'login':
+        return {'email': user.email, 'password': PASSWORD}
+    if endpoint == 'mfa-validate':
+        # Generated at request time, the code has to be current.
+        totp = pyotp.TOTP(secret)
+        return lambda: {'code': totp.now()}
+    if endpoint == 'mfa-disable':
+        return {'code': RECOVERY_CODE}
+    if endpoint == 'mfa-activate':
+        return {'password': PASSWORD}
+    return None
+
+
+def request(port, method, path, body=None, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        connection.request(method, path, json.dumps(body) if body else None, headers)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def scrape(port, endpoint):
+    _, content = request(port, 'GET', '/metrics')
+    totals = {}
+    for name in ('db_queries_total', 'http_requests_total'):
+        match = re.search(rf'^{name}{{view="{endpoint}"}} (\S+)$', content.decode(), re.M)
+        totals[name] = float(match.group(1)) if match else 0.0
+    return totals
+
+
+def drive(port, endpoint, plan, concurrency):
+    method, path = ENDPOINTS[endpoint]
+
+    def call(item):
+        body, token = item
+        if callable(body):
+            body = body()
+        start = time.perf_counter()
+        try:
+            code, _ = request(port, method, path, body, token)
+        except OSError:
+            code = None
+        return time.perf_counter() - start, code
+
+    before = scrape(port, endpoint)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(call, plan))
+    elapsed = time.perf_counter() - start
+    after = scrape(port, endpoint)
+
+    samples = [seconds for seconds, code in results if code is not None and code < 300]
+    handled = after['http_requests_total'] - before['http_requests_total']
+    queries = after['db_queries_total'] - before['db_queries_total']
+    return summarize(samples) | {
+        'throughput_rps': round(len(samples) / elapsed, 2),
+        'errors': len(results) - len(samples),
+        'queries_per_request': round(queries / handled, 2) if handled else None,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(env, port, worker_class, workers, threads):
+    app = 'creze_api.asgi:application' if worker_class == 'uvicorn' else 'creze_api.wsgi:application'
+    env = env | {
+        'GUNICORN_WORKER_CLASS': worker_class,
+        'GUNICORN_WORKERS': str(workers),
+        'GUNICORN_THREADS': str(threads),
+    }
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'config/gunicorn/conf.py',
+         '--bind', f'127.0.0.1:{port}', '--log-level', 'warning',
+         '--access-logfile', os.devnull, app],
+        cwd=BASE_DIR, env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError('gunicorn exited during startup')
+        try:
+            request(port, 'GET', '/metrics')
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not start in 30s')
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Runs in the same process share the database, every run seeds its own users.
+_workdir = None
+
+
+def load_test(database='sqlite', worker_class='gthread', workers=2, threads=4,
+              concurrency=8, requests=200, endpoints=tuple(ENDPOINTS)):
+    global _workdir
+    if _workdir is None:
+        _workdir = tempfile.mkdtemp(prefix='creze_loadtest_')
+    workdir = _workdir
+    env = os.environ | {
+        'DJANGO_ENV': 'dev',
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'METRICS_FLUSH_INTERVAL': '0',
+        'CACHE_DIR': os.path.join(workdir, 'cache'),
+    }
+    if database == 'sqlite':
+        env.pop('POSTGRES_DB', None)
+        env['SQLITE_PATH'] = os.path.join(workdir, 'db.sqlite3')
+    elif not env.get('POSTGRES_DB'):
+        raise SystemExit('--database postgres needs POSTGRES_DB and friends in the environment')
+    os.environ.clear()
+    os.environ.update(env)
+
+    setup_django(test_db=False)
+    from django.core.management import call_command
+    from django.db import connection
+
+    call_command('migrate', verbosity=0)
+    plan = seed(uuid.uuid4().hex[:8], requests)
+    connection.close()
+
+    port = free_port()
+    server = start_server(env, port, worker_class, workers, threads)
+    try:
+        results = {
+            endpoint: drive(port, endpoint, plan[endpoint], concurrency)
+            for endpoint in endpoints
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        'meta': {
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'database': database,
+            'worker_class': worker_class,
+            'workers': workers,
+            'threads': threads,
+            'concurrency': concurrency,
+            'requests': requests,
+        },
+        'endpoints': results,
+    }
+
+
+def run(args):
+    report = load_test(
+        args.database, args.worker_class, args.workers, args.threads,
+        args.concurrency, args.requests, args.endpoints,
+    )
+
+    output = args.output
+    if output is None:
+        os.makedirs(BASE_DIR / 'benchmarks' / 'results', exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = BASE_DIR / 'benchmarks' / 'results' / f'loadtest-{stamp}.json'
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f'Results written to {output}', file=sys.stderr)
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)['endpoints']
+    with open(args.current) as f:
+        current = json.load(f)['endpoints']
+
+    regressions = []
+    for endpoint, new in current.items():
+        old = baseline.get(endpoint)
+        if old is None:
+            continue
+        if old['p95_ms'] and new['p95_ms'] > old['p95_ms'] * (1 + args.tolerance):
+            regressions.append(f"{endpoint}: p95 {old['p95_ms']}ms -> {new['p95_ms']}ms")
+        if new['throughput_rps'] < old['throughput_rps'] * (1 - args.tolerance):
+            regressions.append(
+                f"{endpoint}: throughput {old['throughput_rps']} -> {new['throughput_rps']} rps"
+            )
+        if (old['queries_per_request'] is not None and new['queries_per_request'] is not None
+                and new['queries_per_request'] > old['queries_per_request']):
+            regressions.append(
+                f"{endpoint}: queries per request {old['queries_per_request']}"
+                f" -> {new['queries_per_request']}"
+            )
+        if new['errors'] > old['errors']:
+            regressions.append(f"{endpoint}: errors {old['errors']} -> {new['errors']}")
+
+    for line in regressions:
+        print(line)
+    if regressions:
+        sys.exit(1)
+    print('No regressions')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('--concurrency', type=int, default=8)
+    run_parser.add_argument('--requests', type=int, default=200)
+    run_parser.add_argument('--workers', type=int, default=2)
+    run_parser.add_argument('--database', choices=('sqlite', 'postgres'), default='sqlite')
+    run_parser.add_argument('--worker-class', choices=WORKER_CLASSES, default='gthread')
+    run_parser.add_argument('--threads', type=int, default=4)
+    run_parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    run_parser.add_argument('--output', default=None)
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser('compare')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--tolerance', type=float, default=0.1)
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Login latency under concurrent load, hashing inline vs. in the hashing pool.
+
+    python -m benchmarks.login_pool --concurrency 8 --requests 64
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import setup_django, summarize
+
+
+def run(concurrency, requests):
+    from rest_framework.test import APIClient
+
+    data = {'email': 'bench@example.com', 'password': 'securepassword123'}
+
+    def login(_):
+        client = APIClient()
+        start = time.perf_counter()
+        response = client.post('/api/login/', data, format='json')
+        return time.perf_counter() - start, response.status_code
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(login, range(requests)))
+
+    samples = [elapsed for elapsed, code in results if code == 200]
+    return summarize(samples) | {
+        'rejected_503': sum(1 for _, code in results if code == 503),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-pending', type=int, default=None)
+    args = parser.parse_args()
+
+    setup_django()
+    from users.models import User
+    from utils import hashing
+
+    User.objects.create_user(email='bench@example.com', password='securepassword123')
+
+    report = {}
+    for mode, workers in (('inline', 0), ('pool', args.workers)):
+        pool = hashing.HashingPool(workers, args.max_pending)
+        hashing.hashing_pool = pool
+        report[mode] = run(args.concurrency, args.requests)
+        pool.shutdown()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
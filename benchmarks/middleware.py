@@ -0,0 +1,95 @@
+"""
+Per request cost of the middleware stack: the old flat MIDDLEWARE (sessions,
+CSRF, auth, messages and clickjacking on every request) against the
+current one, where PathScopedMiddleware only runs them outside /api/.
+Requests go through Django's handler in process, "noop" is a view that
+returns an empty response so the difference is the middleware alone.
+
+    python -m benchmarks.middleware --iterations 5000
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import setup_django, summarize
+
+FLAT_MIDDLEWARE = [
+    'utils.metrics.MetricsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+
+def noop(request):
+    from django.http import HttpResponse
+
+    return HttpResponse()
+
+
+urlpatterns = None
+
+
+def measure(handler, request_factory, iterations):
+    samples = []
+    for _ in range(iterations):
+        request = request_factory()
+        start = time.perf_counter()
+        response = handler.get_response(request)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code < 400, (response.status_code, response.content[:200])
+    return summarize(samples)
+
+
+def main():
+    global urlpatterns
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.handlers.base import BaseHandler
+    from django.test import RequestFactory, override_settings
+    from django.urls import include, path
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from users.models import User
+
+    urlpatterns = [
+        path('api/noop/', noop),
+        path('api/', include('users.urls')),
+    ]
+    user = User.objects.create_user(email='bench@example.com', password='securepassword123')
+    token = str(RefreshToken.for_user(user).access_token)
+    factory = RequestFactory()
+    requests = {
+        'noop': lambda: factory.get('/api/noop/'),
+        'mfa_setup': lambda: factory.get(
+            '/api/mfa-setup/', HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_ACCEPT='application/json'
+        ),
+    }
+
+    report = {}
+    stacks = {'flat': FLAT_MIDDLEWARE, 'scoped': settings.MIDDLEWARE}
+    for name, middleware in stacks.items():
+        with override_settings(MIDDLEWARE=middleware, ROOT_URLCONF=__name__):
+            handler = BaseHandler()
+            handler.load_middleware()
+            report[name] = {
+                endpoint: measure(handler, request, args.iterations)
+                for endpoint, request in requests.items()
+            }
+    report['saved_mean_ms'] = {
+        endpoint: round(report['flat'][endpoint]['mean_ms'] - report['scoped'][endpoint]['mean_ms'], 3)
+        for endpoint in requests
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Cost of User.verify_recovery_code against the previous implementation,
+which decrypted the whole Fernet blob, searched it, re-encrypted it and
+saved the full user row on every attempt.
+
+    python -m benchmarks.recovery_codes --iterations 500
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import setup_django, summarize
+
+
+def measure(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django()
+    from cryptography.fernet import Fernet
+    from django.conf import settings
+    from users.models import RecoveryCode, User
+
+    user = User.objects.create_user(email='bench@example.com', password='securepassword123')
+    codes = [f'CODE{i:06d}' for i in range(args.iterations)]
+    RecoveryCode.objects.bulk_create(
+        RecoveryCode(user=user, code_hash=RecoveryCode.hash_code(user.pk, code))
+        for code in codes
+    )
+    cipher = Fernet(settings.ENCRYPTION_KEY)
+    blob = cipher.encrypt(json.dumps(codes[:10]).encode()).decode()
+    hits = iter(codes)
+
+    def legacy_verify(code):
+        recovery_codes = json.loads(cipher.decrypt(blob.encode()).decode())
+        if code in recovery_codes:
+            recovery_codes.remove(code)
+            cipher.encrypt(json.dumps(recovery_codes).encode()).decode()
+            user.save()
+
+    report = {
+        'legacy_miss': measure(lambda: legacy_verify('MISSING000'), args.iterations),
+        'legacy_hit': measure(lambda: legacy_verify(codes[0]), args.iterations),
+        'hashed_miss': measure(lambda: user.verify_recovery_code('MISSING000'), args.iterations),
+        'hashed_hit': measure(lambda: user.verify_recovery_code(next(hits)), args.iterations),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Validation cost per request of the MFA payloads, DRF's Serializer against
+FastSerializer with the same CustomCharField.
+
+    python -m benchmarks.serializers --iterations 20000
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import setup_django, summarize
+
+
+def measure(serializer_class, data, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        serializer = serializer_class(data=data)
+        serializer.is_valid()
+        serializer.validated_data
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    setup_django(test_db=False)
+    from rest_framework import serializers
+    from users.serializers import MFADisableSerializer, MFAValidateSerializer
+    from utils.custom_serializers import CustomCharField
+
+    class DRFValidateSerializer(serializers.Serializer):
+        code = CustomCharField(validate_regex={
+            'regex': r'^\d{6}$', 'error_message': 'Código incompatible'
+        })
+
+    class DRFDisableSerializer(serializers.Serializer):
+        code = CustomCharField(validate_regex={
+            'regex': r'^.{10}$', 'error_message': 'Código incompatible'
+        })
+
+    cases = {
+        'validate': (DRFValidateSerializer, MFAValidateSerializer, {'code': '123456'}),
+        'validate_invalid': (DRFValidateSerializer, MFAValidateSerializer, {'code': '12a'}),
+        'disable': (DRFDisableSerializer, MFADisableSerializer, {'code': 'abcde12345'}),
+    }
+
+    report = {}
+    for name, (drf_class, fast_class, data) in cases.items():
+        report[name] = {
+            'drf': measure(drf_class, data, args.iterations),
+            'fast': measure(fast_class, data, args.iterations),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Where a worker's boot goes and what each gunicorn worker costs in memory.
+
+    python -m benchmarks.startup_profile imports --top 15
+    python -m benchmarks.startup_profile rss --workers 4
+
+"imports" runs the boot of a worker without preload_app (django.setup(),
+the WSGI app and the URLconf) under "python -X importtime" and adds up the
+self import time of every module per top level package. "rss" starts
+gunicorn with GUNICORN_PRELOAD=0 and 1, warms every worker with a few
+requests and reads /proc/<pid>/smaps_rollup: USS (private pages) is what
+each extra worker really costs. Linux only.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from benchmarks.common import BASE_DIR
+from benchmarks.loadtest import free_port, request
+
+BOOT = """
+import os, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'creze_api.settings')
+from creze_api.wsgi import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+print(time.perf_counter() - start)
+"""
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+\d+ \| *(\S+)$')
+
+
+def imports(args):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT],
+        cwd=BASE_DIR, capture_output=True, text=True, check=True,
+    )
+    by_package = defaultdict(float)
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            by_package[match.group(2).split('.')[0]] += int(match.group(1)) / 1000
+
+    top = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:args.top]
+    print(json.dumps({
+        'boot_ms': round(float(result.stdout.strip().splitlines()[-1]) * 1000, 1),
+        'imports_ms': {package: round(ms, 1) for package, ms in top},
+    }, indent=2))
+
+
+def memory(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss_kb': values['Rss'],
+        'pss_kb': values['Pss'],
+        'uss_kb': values['Private_Clean'] + values['Private_Dirty'],
+    }
+
+
+def measure(preload, workers, requests):
+    workdir = tempfile.mkdtemp(prefix='creze_startup_')
+    env = os.environ | {
+        'DJANGO_ENV': 'dev',
+        'GUNICORN_PRELOAD': '1' if preload else '0',
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'SQLITE_PATH': os.path.join(workdir, 'db.sqlite3'),
+    }
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'config/gunicorn/conf.py',
+         '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+         '--log-level', 'warning', '--access-logfile', os.devnull,
+         'creze_api.wsgi:application'],
+        cwd=BASE_DIR, env=env,
+    )
+    try:
+        while True:
+            try:
+                request(port, 'GET', '/metrics')
+                break
+            except OSError:
+                if server.poll() is not None or time.perf_counter() - start > 30:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.05)
+        ready = time.perf_counter() - start
+
+        for _ in range(requests):
+            request(port, 'POST', '/api/login/', {})
+            request(port, 'GET', '/metrics')
+        time.sleep(0.5)
+
+        with open(f'/proc/{server.pid}/task/{server.pid}/children') as f:
+            pids = [int(pid) for pid in f.read().split()]
+        samples = [memory(pid) for pid in pids]
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        'ready_ms': round(ready * 1000, 1),
+        'workers': len(samples),
+        **{key: round(sum(s[key] for s in samples) / len(samples)) for key in samples[0]},
+    }
+
+
+def rss(args):
+    report = {
+        'no_preload': measure(False, args.workers, args.requests),
+        'preload': measure(True, args.workers, args.requests),
+    }
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    imports_parser = subparsers.add_parser('imports')
+    imports_parser.add_argument('--top', type=int, default=15)
+    imports_parser.set_defaults(func=imports)
+
+    rss_parser = subparsers.add_parser('rss')
+    rss_parser.add_argument('--workers', type=int, default=4)
+    rss_parser.add_argument('--requests', type=int, default=50)
+    rss_parser.set_defaults(func=rss)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Per-request cost of the throttle check, DRF's timestamp-list throttle
+against the sliding window counter, on the local memory and file caches.
+
+    python -m benchmarks.throttle --iterations 2000 --rate 1000/minute
+"""
+import argparse
+import json
+import tempfile
+import time
+
+from benchmarks.common import setup_django, summarize
+
+
+def measure(throttle_class, cache, rate, iterations):
+    from django.test import RequestFactory
+
+    class Throttle(throttle_class):
+        THROTTLE_RATES = {'anon': rate}
+
+    Throttle.cache = cache
+    cache.clear()
+    request = RequestFactory().get('/api/login/', REMOTE_ADDR='10.0.0.1')
+    request.user = None
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        Throttle().allow_request(request, None)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--rate', default='1000/minute')
+    args = parser.parse_args()
+
+    setup_django(test_db=False)
+    from django.core.cache.backends.filebased import FileBasedCache
+    from django.core.cache.backends.locmem import LocMemCache
+    from rest_framework import throttling as drf_throttling
+    from utils import throttling
+
+    caches = {
+        'locmem': LocMemCache('benchmark', {}),
+        'file': FileBasedCache(tempfile.mkdtemp(), {}),
+    }
+    report = {}
+    for cache_name, cache in caches.items():
+        for name, throttle_class in (
+            ('drf', drf_throttling.AnonRateThrottle),
+            ('sliding_window', throttling.AnonRateThrottle),
+        ):
+            report[f'{cache_name}_{name}'] = measure(
+                throttle_class, cache, args.rate, args.iterations
+            )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Cost of a TOTP check with the same drift window, pyotp.TOTP(...).verify per
+request against the cached TOTPVerifier (without the replay cache write).
+
+    python -m benchmarks.totp --iterations 20000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.common import setup_django, summarize
+
+
+def measure(check, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        check()
+        samples.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    check()
+    peak = tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return summarize(samples) | {'peak_allocated_bytes': peak}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    setup_django(test_db=False)
+    import pyotp
+    from users.totp import TOTPVerifier
+
+    secret = pyotp.random_base32()
+    verifier = TOTPVerifier(valid_window=1)
+    code = pyotp.TOTP(secret).now()
+
+    report = {
+        'pyotp': measure(lambda: pyotp.TOTP(secret).verify(code, valid_window=1), args.iterations),
+        'verifier': measure(lambda: verifier.match(1, secret, code), args.iterations),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+Time a gunicorn worker boot (settings import and django.setup()) in fresh
+interpreters, run it with and without SECRETS_CACHE_FILE to compare.
+
+    DJANGO_ENV=prod SECRETS_CACHE_FILE=/tmp/creze_secrets.json \\
+        python -m benchmarks.worker_boot --runs 10
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from benchmarks.common import BASE_DIR, summarize
+
+BOOT = """
+import os, time
+start = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'creze_api.settings')
+import django
+django.setup()
+print(time.perf_counter() - start)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    samples = []
+    for _ in range(args.runs):
+        output = subprocess.check_output([sys.executable, '-c', BOOT], cwd=BASE_DIR)
+        samples.append(float(output.decode().strip().splitlines()[-1]))
+
+    print(json.dumps(summarize(samples), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Runs the load test once per gunicorn worker class and picks the best one
+for each endpoint (highest throughput, p95 as tie breaker) and for the
+CPU-bound (login, signup, mfa-activate hash passwords) and I/O-bound mixes.
+
+    python -m benchmarks.worker_modes --modes sync gthread uvicorn --requests 100
+
+The worker count is the one config/gunicorn/conf.py computes for each mode
+unless "--workers" is given.
+"""
+import argparse
+import json
+import os
+import statistics
+from datetime import datetime
+
+from benchmarks.common import BASE_DIR
+from benchmarks.loadtest import ENDPOINTS, WORKER_CLASSES, load_test
+
+MIXES = {
+    'cpu': ['login', 'signup', 'mfa-activate'],
+    'io': ['mfa-setup', 'mfa-validate', 'mfa-disable'],
+}
+
+
+def default_workers(mode):
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    return 2 * cpus + 1 if mode == 'sync' else cpus + 1
+
+
+def best(results, endpoints):
+    def score(mode):
+        runs = [results[mode]['endpoints'][endpoint] for endpoint in endpoints]
+        throughput = statistics.fmean(run['throughput_rps'] for run in runs)
+        p95 = statistics.fmean(run['p95_ms'] for run in runs)
+        return throughput, -p95
+
+    return max(results, key=score)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', nargs='+', choices=WORKER_CLASSES, default=list(WORKER_CLASSES))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--database', choices=('sqlite', 'postgres'), default='sqlite')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.modes:
+        results[mode] = load_test(
+            args.database, mode, args.workers or default_workers(mode), args.threads,
+            args.concurrency, args.requests,
+        )
+
+    report = {
+        'results': results,
+        'best': {
+            **{endpoint: best(results, [endpoint]) for endpoint in ENDPOINTS},
+            **{f'{mix}_mix': best(results, endpoints) for mix, endpoints in MIXES.items()},
+        },
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(BASE_DIR / 'benchmarks' / 'results', exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = BASE_DIR / 'benchmarks' / 'results' / f'worker-modes-{stamp}.json'
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for mode, result in results.items():
+        for endpoint, run in result['endpoints'].items():
+            print(f"{mode:8} {endpoint:13} {run['throughput_rps']:8.1f} rps  p95 {run['p95_ms']:8.1f}ms"
+                  f"  errors {run['errors']}")
+    print(json.dumps(report['best'], indent=2))
+
+
+if __name__ == '__main__':
+    main()
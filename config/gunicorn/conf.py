@@ -1,5 +1,123 @@
+"""
+Gunicorn settings sized from the CPUs available to the container. Every
+value can be overridden with the GUNICORN_* env variables.
+
+GUNICORN_WORKER_CLASS:
+    sync     one request at a time per worker, 2 * CPUs + 1 workers.
+    gthread  (default) CPUs + 1 workers with GUNICORN_THREADS threads each,
+             the threads cover the waits on the DB, Lambda and the hashing pool.
+    gevent   CPUs + 1 workers with GUNICORN_WORKER_CONNECTIONS greenlets,
+             psycogreen keeps the DB calls from blocking the worker. The
+             app is not preloaded, gevent has to patch the stdlib before
+             it is imported.
+    uvicorn  CPUs + 1 workers running the async views (ASYNC_VIEWS=1), serve
+             creze_api.asgi:application with it.
+"""
+import gc
+import math
+import os
+
 name = "creze_api"
 loglevel = "info"
 errorlog = "-"
 accesslog = "-"
-workers = 2
+
+
+def available_cpus():
+    # cgroup v2 quota ("max 100000" or "200000 100000"), then the affinity mask.
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+cpus = available_cpus()
+mode = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+
+if mode == "sync":
+    worker_class = "sync"
+    default_workers = 2 * cpus + 1
+elif mode == "gthread":
+    worker_class = "gthread"
+    default_workers = cpus + 1
+    threads = int(os.getenv("GUNICORN_THREADS", 4))
+elif mode == "gevent":
+    worker_class = "gevent"
+    default_workers = cpus + 1
+    worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 100))
+elif mode == "uvicorn":
+    worker_class = "uvicorn.workers.UvicornWorker"
+    default_workers = cpus + 1
+else:
+    raise ValueError(f"GUNICORN_WORKER_CLASS inválido: {mode}")
+
+workers = int(os.getenv("GUNICORN_WORKERS", default_workers))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+# Recycle workers to bound slow leaks, the jitter keeps them from all
+# restarting at the same time.
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", max_requests // 10))
+
+raw_env = []
+if mode == "uvicorn":
+    raw_env.append("ASYNC_VIEWS=1")
+# Each worker has its own password hashing pool, split the CPUs among them.
+if "HASHING_POOL_WORKERS" not in os.environ:
+    raw_env.append(f"HASHING_POOL_WORKERS={max(1, math.ceil(cpus / workers))}")
+# Let every thread or greenlet wait for a hash, like a sync worker waits in
+# the backlog. Under uvicorn the async views wait for a slot themselves, see
+# HashingPool.arun.
+if "HASHING_POOL_MAX_PENDING" not in os.environ:
+    if mode == "gthread":
+        raw_env.append(f"HASHING_POOL_MAX_PENDING={threads}")
+    elif mode == "gevent":
+        raw_env.append(f"HASHING_POOL_MAX_PENDING={worker_connections}")
+
+# Import the app once in the master and fork the workers from it.
+preload_app = os.getenv("GUNICORN_PRELOAD", "0" if mode == "gevent" else "1") == "1"
+
+
+def post_fork(server, worker):
+    if mode != "gevent":
+        return
+    from psycogreen.gevent import patch_psycopg
+
+    patch_psycopg()
+
+
+def worker_exit(server, worker):
+    from utils.metrics import registry
+
+    registry.flush()
+
+
+def child_exit(server, worker):
+    # Recycled workers (max_requests) would otherwise leave their file, and
+    # their gauges, in METRICS_DIR forever.
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "creze_api.settings")
+    from utils.metrics import registry
+
+    registry.retire(worker.pid)
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from creze_api.prefork import warm_up
+
+    warm_up()
+    # Objects that exist before the fork go to the permanent generation, the
+    # collector of each worker won't write to their pages.
+    gc.collect()
+    gc.freeze()
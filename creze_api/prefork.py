@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+from rest_framework.settings import api_settings
+from utils import hashing
+
+
+def warm_up():
+    """
+    Loads in the gunicorn master what Django, DRF and the AWS clients import
+    lazily on the first request, so with preload_app those modules live in
+    pages the workers share copy-on-write instead of one copy per worker.
+    """
+    get_resolver().url_patterns
+    for name in ('DEFAULT_AUTHENTICATION_CLASSES', 'DEFAULT_PERMISSION_CLASSES',
+                 'DEFAULT_PARSER_CLASSES', 'DEFAULT_RENDERER_CLASSES',
+                 'DEFAULT_THROTTLE_CLASSES'):
+        getattr(api_settings, name)
+
+    if settings.ENVIRONMENT == 'prod':
+        import boto3  # noqa: F401
+
+    # Inherited by the workers, the first bulk signup doesn't measure it.
+    hashing.measure_hash_seconds()
+
+    # Sockets must not be shared with the workers.
+    connections.close_all()
@@ -10,10 +10,13 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
 from utils.common_functions import get_secret
 from datetime import timedelta
+import json
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -24,6 +27,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 ENVIRONMENT = os.getenv('DJANGO_ENV', 'dev')
 
+# Serve /api/ with the async views, meant for the uvicorn worker deployment.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS') == '1'
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -39,15 +45,28 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'utils.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'utils.middleware.PathScopedMiddleware',
+]
+
+# The API authenticates with JWT, sessions, CSRF, auth, messages and
+# X-Frame-Options are only for the admin. PathScopedMiddleware runs these
+# for every path outside STATELESS_PATH_PREFIXES.
+SCOPED_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+STATELESS_PATH_PREFIXES = ['/api/', '/metrics']
+
+# The admin looks for its middleware in MIDDLEWARE only, they are in
+# SCOPED_MIDDLEWARE.
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
 
 ROOT_URLCONF = 'creze_api.urls'
 
@@ -71,17 +90,44 @@ WSGI_APPLICATION = 'creze_api.wsgi.application'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'utils.fast_json.FastJSONRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'utils.fast_json.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.UserRateThrottle',
-        'rest_framework.throttling.AnonRateThrottle',
+        'utils.throttling.UserRateThrottle',
+        'utils.throttling.AnonRateThrottle',
+        'utils.throttling.ScopedRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'user': '30/minute',
         'anon': '3/minute',
+        'login': '5/minute',
+        'signup': '3/minute',
+        'mfa-validate': '5/minute',
+    },
+    # nginx appends the client address to X-Forwarded-For, the throttles and
+    # the login lockout key on that entry and not on what the client sent.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 1)),
+}
+
+# Throttling counters, lockouts, the TOTP replay set and the other per-user
+# state must be shared by every gunicorn worker and rely on atomic add() and
+# incr(), prod requires Redis. The file cache is only the dev stand-in, the
+# tests use LocMemCache (utils/test_runner.py).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'creze_api_cache')),
     }
 }
+TEST_RUNNER = 'utils.test_runner.TestRunner'
 
 if ENVIRONMENT == 'prod':
     secrets = get_secret()
@@ -98,28 +144,104 @@ if ENVIRONMENT == 'prod':
             'PASSWORD': secrets.get('POSTGRES_PASSWORD'),
             'HOST': secrets.get('DB_HOST'),
             'PORT': secrets.get('DB_PORT'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
         }
     }
+    DB_REPLICA_HOSTS = secrets.get('DB_REPLICA_HOSTS', '')
     ENCRYPTION_KEY = secrets.get('ENCRYPTION_KEY')
+    # {"<id>": "<fernet key>"}, old keys stay until rotate_encryption_key ends.
+    ENCRYPTION_KEYS = secrets.get('ENCRYPTION_KEYS') or {'1': ENCRYPTION_KEY}
+    if isinstance(ENCRYPTION_KEYS, str):
+        ENCRYPTION_KEYS = json.loads(ENCRYPTION_KEYS)
+    ENCRYPTION_PRIMARY_KEY_ID = secrets.get('ENCRYPTION_PRIMARY_KEY_ID', '1')
     SECRET_KEY = secrets.get('SECRET_KEY')
     SIMPLE_JWT = {'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5)}
+    REDIS_URL = os.getenv('REDIS_URL') or secrets.get('REDIS_URL')
+    if not REDIS_URL:
+        raise ImproperlyConfigured('REDIS_URL es obligatorio en prod, el caché en archivos no es atómico')
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+    EMAIL_OUTBOX = {
+        'BACKEND': 'utils.email_outbox.LambdaBackend',
+        'OPTIONS': {'function_name': 'send_email_creze', 'region_name': 'us-east-1'},
+    }
 else:
     DEBUG = True
     ALLOWED_HOSTS = ['*']
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3'
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3')
         }
     }
+    if os.getenv('POSTGRES_DB'):
+        DATABASES['default'] = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB'),
+            'USER': os.getenv('POSTGRES_USER'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    DB_REPLICA_HOSTS = os.getenv('DB_REPLICA_HOSTS', '')
     ENCRYPTION_KEY = 'VAZS9fuQmb5vN2Rkqh5pTDVc_nuL47ImjLa1NoYOuZc='
+    ENCRYPTION_KEYS = {'1': ENCRYPTION_KEY}
+    ENCRYPTION_PRIMARY_KEY_ID = '1'
     SECRET_KEY = 'django-insecure-@oyxq)cg+xie^n=hb$x-12h9e75^ze1hnse=#)62kn559w3@$2'
     SIMPLE_JWT = {'ACCESS_TOKEN_LIFETIME': timedelta(minutes=1000)}
+    EMAIL_OUTBOX = {'BACKEND': 'utils.email_outbox.InMemoryBackend'}
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('rest_framework.renderers.BrowsableAPIRenderer')
     REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] = {
         'anon': None,
         'user': None,
+        'login': None,
+        'signup': None,
+        'mfa-validate': None,
+    }
+
+# In-process connection pool, Django gives the connection back to the pool at
+# the end of every request instead of closing it.
+if os.getenv('DB_POOL') == '1' and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['default'] |= {
+        'ENGINE': 'utils.db_pool',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MIN_SIZE': int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+            'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 5)),
+        },
     }
 
+# Read replicas of "default", utils/db_router.py sends the users app reads to
+# them. Each one copies the default settings with its own "host[:port]" from
+# DB_REPLICA_HOSTS (comma separated) or, on SQLite, its own file from
+# SQLITE_REPLICA_PATHS. Nothing replicates the test database, in tests they
+# mirror "default" and utils/test_runner.py adds one if there are none.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    replica_overrides = [{'NAME': path} for path in os.getenv('SQLITE_REPLICA_PATHS', '').split(',') if path]
+else:
+    replica_overrides = [
+        {'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+        for host, _, port in (item.partition(':') for item in DB_REPLICA_HOSTS.split(',') if item)
+    ]
+DATABASE_REPLICAS = []
+for index, overrides in enumerate(replica_overrides, 1):
+    DATABASES[f'replica_{index}'] = DATABASES['default'] | overrides | {'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{index}')
+DATABASE_ROUTERS = ['utils.db_router.ReplicaRouter']
+
+# A replica more than REPLICA_MAX_LAG seconds behind, measured every
+# REPLICA_CHECK_INTERVAL seconds, isn't read until it catches up. A user's
+# reads stay on the primary for REPLICA_PIN_SECONDS after the user changes.
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 2))
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', 3))
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -138,6 +260,37 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# New hashes use PASSWORD_HASHER, the other hashers still verify old hashes,
+# which are upgraded in the background after the next successful login.
+# "python manage.py calibrate_hasher" measures the cost that fits a latency
+# budget on this host.
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'scrypt')
+PASSWORD_HASHER_COST = {
+    'scrypt': {
+        'work_factor': int(os.getenv('SCRYPT_WORK_FACTOR', 2 ** 14)),
+        'block_size': int(os.getenv('SCRYPT_BLOCK_SIZE', 8)),
+        'parallelism': 1,
+    },
+    'argon2': {
+        'time_cost': int(os.getenv('ARGON2_TIME_COST', 2)),
+        'memory_cost': int(os.getenv('ARGON2_MEMORY_COST', 65536)),
+        'parallelism': int(os.getenv('ARGON2_PARALLELISM', 1)),
+    },
+    'pbkdf2_sha256': {'iterations': int(os.getenv('PBKDF2_ITERATIONS', 600000))},
+}
+PASSWORD_HASHER_CLASSES = {
+    'scrypt': 'utils.hashers.ScryptPasswordHasher',
+    'argon2': 'utils.hashers.Argon2PasswordHasher',
+    'pbkdf2_sha256': 'utils.hashers.PBKDF2PasswordHasher',
+}
+# Milliseconds of one hash at that cost, printed by calibrate_hasher, 0 measures
+# it in the gunicorn master (or once per process in the hashing pool). Bounds
+# the bulk signup size, see utils/hashing.py.
+PASSWORD_HASH_MS = float(os.getenv('PASSWORD_HASH_MS', 0))
+PASSWORD_HASHERS = [PASSWORD_HASHER_CLASSES[PASSWORD_HASHER]] + [
+    path for algorithm, path in PASSWORD_HASHER_CLASSES.items() if algorithm != PASSWORD_HASHER
+]
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
 
@@ -165,3 +318,37 @@ CORS_ORIGIN_ALLOW_ALL = True
 AUTH_USER_MODEL = 'users.User'
 
 ISSUER_NAME = 'CrezeApp'
+
+# Time steps of 30s accepted before and after the current one, see users/totp.py.
+# 0 accepts only the current code, 1 tolerates clock drift but widens it to 90s.
+TOTP_VALID_WINDOW = int(os.getenv('TOTP_VALID_WINDOW', 0))
+
+# Failed logins counted per email and per IP during LOGIN_LOCKOUT_WINDOW
+# seconds, reaching the threshold locks them for LOGIN_LOCKOUT_BASE seconds,
+# doubled on every further failure up to LOGIN_LOCKOUT_MAX. See users/lockout.py.
+LOGIN_LOCKOUT_THRESHOLD = int(os.getenv('LOGIN_LOCKOUT_THRESHOLD', 5))
+LOGIN_LOCKOUT_IP_THRESHOLD = int(os.getenv('LOGIN_LOCKOUT_IP_THRESHOLD', 20))
+LOGIN_LOCKOUT_BASE = int(os.getenv('LOGIN_LOCKOUT_BASE', 60))
+LOGIN_LOCKOUT_MAX = int(os.getenv('LOGIN_LOCKOUT_MAX', 3600))
+LOGIN_LOCKOUT_WINDOW = int(os.getenv('LOGIN_LOCKOUT_WINDOW', 900))
+
+# Password hashing runs in a process pool per gunicorn worker, requests that
+# find HASHING_POOL_MAX_PENDING hashes in flight get a 503.
+HASHING_POOL_WORKERS = int(os.getenv('HASHING_POOL_WORKERS', os.cpu_count() or 1))
+HASHING_POOL_MAX_PENDING = int(os.getenv('HASHING_POOL_MAX_PENDING', HASHING_POOL_WORKERS * 2))
+HASHING_POOL_TIMEOUT = 10
+
+# Users kept by each worker's authentication cache, see users/cache.py.
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+
+# Users accepted per request by /api/signup/bulk/, their passwords are hashed
+# in the request. Fewer when hashing them would take over half of
+# HASHING_POOL_TIMEOUT, see utils.hashing.max_batch_size.
+SIGNUP_BULK_MAX_SIZE = int(os.getenv('SIGNUP_BULK_MAX_SIZE', 100))
+
+# MFA setup QR codes kept rendered by each worker, see users/provisioning.py.
+QR_CACHE_SIZE = int(os.getenv('QR_CACHE_SIZE', 1000))
+
+# Every worker dumps its request metrics here, /metrics adds them up.
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'creze_api_metrics'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1))
@@ -14,10 +14,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
+from utils.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/', include('users.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    path('api/', include('users.async_urls' if settings.ASYNC_VIEWS else 'users.urls')),
 ]
@@ -1,7 +1,22 @@
 #!/bin/bash
 
-python manage.py collectstatic --no-input
-python manage.py migrate
+# One-shot step, run by the "creze-migrate" service before the API starts.
+if [ "$SERVER_MODE" = "migrate" ]; then
+    python manage.py collectstatic --no-input
+    exec python manage.py migrate
+fi
+
+# Metrics of a previous run would be added to the new ones.
+rm -rf "${METRICS_DIR:-/tmp/creze_api_metrics}"
+
+if [ "$SERVER_MODE" = "asgi" ]; then
+    export GUNICORN_WORKER_CLASS=uvicorn
+    exec gunicorn -c config/gunicorn/conf.py \
+         --bind :8000 \
+         --chdir creze_api \
+         creze_api.asgi:application
+fi
+
 exec gunicorn -c config/gunicorn/conf.py \
      --bind :8000 \
      --chdir creze_api \
@@ -14,6 +14,8 @@ class UserAdmin(admin.ModelAdmin):
     search_fields = [
         "email",
     ]
+    # Skip the unfiltered COUNT(*) on every changelist page.
+    show_full_result_count = False
     list_filter = [
         "is_active",
         "otp_activated",
@@ -0,0 +1,15 @@
+from django.urls import path
+from .async_views import *
+from .views import BulkSignupView, RecoveryCodesView, UserListView
+
+urlpatterns = [
+    path('login/', LoginView.as_view(), name='login'),
+    path('signup/', SignInView.as_view(), name='signup'),
+    path('signup/bulk/', BulkSignupView.as_view(), name='signup-bulk'),
+    path('mfa-setup/', MFASetupView.as_view(), name='mfa-setup'),
+    path('mfa-validate/', MFAValidateView.as_view(), name='mfa-validate'),
+    path('mfa-disable/', MFADisableView.as_view(), name='mfa-disable'),
+    path('mfa-activate/', MFAActivateView.as_view(), name='mfa-activate'),
+    path('mfa-recovery-codes/', RecoveryCodesView.as_view(), name='mfa-recovery-codes'),
+    path('users/', UserListView.as_view(), name='user-list')
+]
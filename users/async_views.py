@@ -0,0 +1,276 @@
+import asyncio
+import functools
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse, JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .serializers import *
+from .lockout import LockedOut, client_ip, login_lockout
+from .models import User
+from .provisioning import etag, not_modified, provisioning_cache
+from .totp import totp_verifier
+from utils import hashing
+from utils.metrics import timed
+
+
+async def run_cpu_bound(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+
+async def aauthenticate(email, password):
+    try:
+        user = await User.objects.aget_by_natural_key(email)
+    except User.DoesNotExist:
+        await hashing.amake_password(password)
+        return None
+
+    if await user.acheck_password(password) and user.is_active:
+        return user
+
+
+class AsyncAPIView(View):
+    """
+    Minimal async counterpart of DRF's APIView, it runs the configured
+    authentication, permission and throttle classes and renders errors the
+    same way, so the async views answer exactly like the sync ones.
+    """
+
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    permission_classes = []
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Token authenticated like APIView, which is CSRF exempt as well.
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            await self.initial(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.handle_exception(request, exc)
+
+    async def initial(self, request):
+        self.authenticators = [auth() for auth in self.authentication_classes]
+        request.data = self.parse(request)
+        request.user = await self.authenticate(request)
+        for permission in [permission() for permission in self.permission_classes]:
+            if not permission.has_permission(request, self):
+                if request.user.is_authenticated:
+                    raise exceptions.PermissionDenied()
+                raise exceptions.NotAuthenticated()
+        await self.check_throttles(request)
+
+    def parse(self, request):
+        if request.content_type != 'application/json':
+            return request.POST
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            raise exceptions.ParseError()
+
+    async def authenticate(self, request):
+        for authenticator in self.authenticators:
+            user_auth = await sync_to_async(authenticator.authenticate)(request)
+            if user_auth is not None:
+                return user_auth[0]
+        return AnonymousUser()
+
+    async def check_throttles(self, request):
+        for throttle in [throttle() for throttle in self.throttle_classes]:
+            if not await sync_to_async(throttle.allow_request)(request, self):
+                raise exceptions.Throttled(throttle.wait())
+
+    def handle_exception(self, request, exc):
+        if isinstance(exc.detail, (list, dict)):
+            data = exc.detail
+        else:
+            data = {'detail': exc.detail}
+        response = JsonResponse(data, status=exc.status_code, safe=False)
+
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            if self.authenticators:
+                auth_header = self.authenticators[0].authenticate_header(request)
+                if auth_header:
+                    response['WWW-Authenticate'] = auth_header
+                else:
+                    response.status_code = status.HTTP_403_FORBIDDEN
+        if getattr(exc, 'wait', None):
+            response['Retry-After'] = '%d' % exc.wait
+        return response
+
+
+class LoginView(AsyncAPIView):
+
+    throttle_scope = 'login'
+
+    async def post(self, request):
+        serializer = LoginSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        email = serializer.validated_data.get("email")
+        password = serializer.validated_data.get("password")
+        ip = client_ip(request)
+        wait = await sync_to_async(login_lockout.locked)(email, ip)
+        if wait:
+            raise LockedOut(wait)
+
+        user = await aauthenticate(email, password)
+        if not user:
+            await sync_to_async(login_lockout.failed)(email, ip)
+            error = {'detail': 'Credenciales inválidas'}
+            return JsonResponse(error, status=status.HTTP_401_UNAUTHORIZED)
+
+        await sync_to_async(login_lockout.succeeded)(email)
+
+        refresh = RefreshToken.for_user(user)
+        resp = {
+            'token': str(refresh.access_token),
+            'otp_activated': user.otp_activated,
+            'otp_verified': user.otp_verified
+        }
+        return JsonResponse(resp, status=status.HTTP_200_OK)
+
+
+class SignInView(AsyncAPIView):
+
+    throttle_scope = 'signup'
+
+    async def post(self, request):
+        serializer = UserSerializer(data=request.data)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        email = serializer.validated_data['email']
+        password = await hashing.amake_password(serializer.validated_data['password'])
+
+        if await sync_to_async(User.objects.signup)(email, password) is None:
+            error = {'email': [EMAIL_TAKEN]}
+            return JsonResponse(error, status=status.HTTP_400_BAD_REQUEST)
+
+        return HttpResponse(status=status.HTTP_201_CREATED)
+
+
+class MFASetupView(AsyncAPIView):
+
+    permission_classes = [IsAuthenticated]
+
+    async def get(self, request):
+        user = request.user
+
+        if user.otp_verified:
+            error = {"detail": ["Error en la petición"]}
+            return JsonResponse(error, status=status.HTTP_400_BAD_REQUEST)
+
+        image_format = request.GET.get('qr')
+        if image_format is not None and image_format not in provisioning_cache.content_types:
+            error = {"qr": ["Formato inválido, usa svg o png"]}
+            return JsonResponse(error, status=status.HTTP_400_BAD_REQUEST)
+
+        if user.otp_secret is None:
+            await user.aprovision_otp_secret()
+        fingerprint = provisioning_cache.user_fingerprint(user)
+        headers = {'ETag': etag(fingerprint, image_format), 'Cache-Control': 'private, no-cache'}
+        if not_modified(request, headers['ETag']):
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        if image_format:
+            _, image = await run_cpu_bound(provisioning_cache.qr, user, image_format)
+            content_type = provisioning_cache.content_types[image_format]
+            return HttpResponse(image, content_type=content_type, headers=headers)
+        _, otp_uri = provisioning_cache.uri(user)
+        data = {"otp_uri": otp_uri}
+        return JsonResponse(data, status=status.HTTP_200_OK, headers=headers)
+
+
+class MFAValidateView(AsyncAPIView):
+
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'mfa-validate'
+
+    async def post(self, request):
+        serializer = MFAValidateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        code = serializer.validated_data.get('code')
+        user = request.user
+        with timed('totp'):
+            # A few HMACs, cheaper than a hop to the thread pool.
+            valid = totp_verifier.verify(user.pk, user.otp_secret, code)
+        if not valid:
+            error = {"code": ["Código OTP inválido"]}
+            return JsonResponse(error, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            recovery_codes = await sync_to_async(user.mark_otp_verified)()
+        except Exception:
+            error = {'detail': 'Ha ocurrido un error inesperado'}
+            return JsonResponse(error, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if recovery_codes:
+            resp = {"recovery_codes": recovery_codes}
+            return JsonResponse(resp, status=status.HTTP_200_OK)
+
+        return HttpResponse(status=status.HTTP_200_OK)
+
+
+class MFADisableView(AsyncAPIView):
+
+    permission_classes = [IsAuthenticated]
+
+    async def post(self, request):
+        serializer = MFADisableSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        code = serializer.validated_data.get('code')
+        user = request.user
+        if not user.otp_activated:
+            error = {"detail": ["Error en la petición"]}
+            return JsonResponse(error, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            disabled = await sync_to_async(user.disable_otp)(code)
+        except Exception:
+            error = {'detail': 'Ha ocurrido un error inesperado'}
+            return JsonResponse(error, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if not disabled:
+            error = {'code': 'Código inválido'}
+            return JsonResponse(error, status=status.HTTP_400_BAD_REQUEST)
+
+        return HttpResponse(status=status.HTTP_200_OK)
+
+
+class MFAActivateView(AsyncAPIView):
+
+    permission_classes = [IsAuthenticated]
+
+    async def post(self, request):
+        serializer = MFAActivateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = request.user
+        password = serializer.validated_data.get('password')
+
+        if user.otp_activated:
+            error = {"detail": ["Error en la petición"]}
+            return JsonResponse(error, status=status.HTTP_400_BAD_REQUEST)
+
+        if not await user.acheck_password(password):
+            error = {'password': 'Contraseña inválida'}
+            return JsonResponse(error, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            activated = await user.aactivate_otp()
+        except Exception:
+            error = {'detail': 'Ha ocurrido un error inesperado'}
+            return JsonResponse(error, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if not activated:
+            error = {"detail": ["Error en la petición"]}
+            return JsonResponse(error, status=status.HTTP_400_BAD_REQUEST)
+
+        return HttpResponse(status=status.HTTP_200_OK)
@@ -0,0 +1,87 @@
+import copy
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, router, transaction
+from utils.db_router import replicas
+
+
+class UserCache:
+    """
+    Per-process LRU of User rows. Every entry is tagged with the user's
+    version token, kept in the shared cache and replaced whenever the row
+    changes, so a hit costs one shared cache read instead of a query and a
+    write in any worker invalidates the copies of all the others. A changed
+    row is reloaded from the primary until the replicas have it, by pk here
+    and by email in UserManager.get_by_natural_key.
+    """
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def version_key(user_id):
+        return f'user-version:{user_id}'
+
+    def get(self, user_id):
+        key = self.version_key(user_id)
+        version = cache.get(key)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and version is not None and entry[0] == version:
+                self._entries.move_to_end(user_id)
+                return copy.copy(entry[1])
+
+        if version is None:
+            cache.add(key, uuid.uuid4().hex, None)
+            version = cache.get(key)
+
+        user = self._load(user_id)
+        with self._lock:
+            self._entries[user_id] = (version, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return copy.copy(user)
+
+    @staticmethod
+    def _load(user_id):
+        User = get_user_model()
+        if replicas.pinned(f'user:{user_id}'):
+            using = DEFAULT_DB_ALIAS
+        else:
+            using = router.db_for_read(User)
+        try:
+            return User.objects.using(using).get(pk=user_id)
+        except User.DoesNotExist:
+            if using == DEFAULT_DB_ALIAS:
+                raise
+            return User.objects.using(DEFAULT_DB_ALIAS).get(pk=user_id)
+
+    def invalidate(self, user_id, email=None):
+        self._bump(user_id, email)
+        # A worker may reload the row before the transaction commits, bump the
+        # version again once the change is visible to everyone.
+        if connection.in_atomic_block:
+            transaction.on_commit(lambda: self._bump(user_id, email))
+
+    def _bump(self, user_id, email):
+        cache.set(self.version_key(user_id), uuid.uuid4().hex, None)
+        replicas.pin(f'user:{user_id}')
+        if email:
+            replicas.pin(f'user-email:{email}')
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(settings.USER_CACHE_SIZE)
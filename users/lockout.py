@@ -0,0 +1,93 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+
+class LockedOut(Throttled):
+    default_detail = 'Demasiados intentos fallidos.'
+    extra_detail_singular = 'Intenta de nuevo en {wait} segundo.'
+    extra_detail_plural = 'Intenta de nuevo en {wait} segundos.'
+
+
+class LoginLockout:
+    """
+    Failed login counters per email and per client IP in the shared cache.
+    Once a counter reaches its threshold the key is locked for
+    base * 2 ** (failures - threshold) seconds (capped at max_lockout), the
+    lock is a "lockout:<kind>:<value>" entry holding its expiry time that
+    the cache drops by itself. Checking is one get_many, so locked requests
+    are rejected before any password is hashed.
+    """
+
+    timer = time.time
+
+    def __init__(self, threshold=5, ip_threshold=20, base=60, max_lockout=3600, window=900):
+        self.thresholds = {'email': threshold, 'ip': ip_threshold}
+        self.base = base
+        self.max_lockout = max_lockout
+        self.window = window
+
+    @staticmethod
+    def identities(email, ip):
+        identities = {'email': email.strip().lower()}
+        if ip:
+            identities['ip'] = ip
+        return identities
+
+    @staticmethod
+    def lock_key(kind, value):
+        return f'lockout:{kind}:{value}'
+
+    @staticmethod
+    def failures_key(kind, value):
+        return f'login-failures:{kind}:{value}'
+
+    def locked(self, email, ip):
+        """Seconds left of the longest lockout of the email or the IP, 0 if none."""
+        keys = [self.lock_key(kind, value) for kind, value in self.identities(email, ip).items()]
+        until = cache.get_many(keys).values()
+        return max([0, *(expiry - self.timer() for expiry in until)])
+
+    def lockout_seconds(self, failures, threshold):
+        if failures < threshold:
+            return 0
+        return min(self.base * 2 ** min(failures - threshold, 16), self.max_lockout)
+
+    def failed(self, email, ip):
+        for kind, value in self.identities(email, ip).items():
+            key = self.failures_key(kind, value)
+            if cache.add(key, 1, self.window):
+                failures = 1
+            else:
+                try:
+                    failures = cache.incr(key)
+                except ValueError:
+                    failures = 1
+                    cache.set(key, failures, self.window)
+
+            seconds = self.lockout_seconds(failures, self.thresholds[kind])
+            if seconds:
+                cache.set(self.lock_key(kind, value), self.timer() + seconds, seconds)
+                # The count has to outlive the lockout for the next one to be longer.
+                cache.touch(key, self.window + seconds)
+
+    def succeeded(self, email):
+        cache.delete(self.failures_key('email', email.strip().lower()))
+
+
+def client_ip(request):
+    # Same X-Forwarded-For handling as the throttles, the last NUM_PROXIES
+    # entry is the one nginx appended, the ones before it are client supplied.
+    return BaseThrottle().get_ident(request)
+
+
+login_lockout = LoginLockout(
+    threshold=settings.LOGIN_LOCKOUT_THRESHOLD,
+    ip_threshold=settings.LOGIN_LOCKOUT_IP_THRESHOLD,
+    base=settings.LOGIN_LOCKOUT_BASE,
+    max_lockout=settings.LOGIN_LOCKOUT_MAX,
+    window=settings.LOGIN_LOCKOUT_WINDOW,
+)
@@ -0,0 +1,102 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils.module_loading import import_string
+
+# Cost parameters stepped per algorithm, in order: (name, env variable, first
+# value, next value). Argon2's memory (KiB) is raised first, up to
+# --max-memory-mb, and then its passes with that memory.
+STEPS = {
+    'scrypt': [('work_factor', 'SCRYPT_WORK_FACTOR', 2 ** 12, lambda value: value * 2)],
+    'argon2': [
+        ('memory_cost', 'ARGON2_MEMORY_COST', 2 ** 14, lambda value: value * 2),
+        ('time_cost', 'ARGON2_TIME_COST', 1, lambda value: value + 1),
+    ],
+    'pbkdf2_sha256': [('iterations', 'PBKDF2_ITERATIONS', 100000, lambda value: value * 2)],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the password hasher cost that fits a latency budget on this "
+        "host. Each cost parameter of the algorithm is raised until one hash "
+        "takes longer than --target-ms (Argon2's memory also stops at "
+        "--max-memory-mb, every pool process hashes with that much), every "
+        "step reports the wall and CPU time of a hash and the logins per "
+        "second one core can verify, and the env variables of the highest "
+        "cost within budget are printed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algorithm', choices=STEPS, default=settings.PASSWORD_HASHER)
+        parser.add_argument('--target-ms', type=float, default=250)
+        parser.add_argument('--samples', type=int, default=5)
+        parser.add_argument('--max-steps', type=int, default=12)
+        parser.add_argument('--max-memory-mb', type=int, default=64)
+
+    def handle(self, *args, **options):
+        algorithm = options['algorithm']
+        target = options['target_ms']
+        steps = STEPS[algorithm]
+        hasher = import_string(settings.PASSWORD_HASHER_CLASSES[algorithm])()
+        current = {name: settings.PASSWORD_HASHER_COST[algorithm][name] for name, *_ in steps}
+
+        wall, cpu = self.measure(hasher, algorithm, current, options['samples'])
+        self.report(f'{self.label(current)} (actual)', wall, cpu)
+
+        # The parameters not stepped yet stay at their first value.
+        chosen = {name: value for name, _, value, _ in steps}
+        for index, (name, env, value, next_value) in enumerate(steps):
+            found = None
+            if index:
+                # Its first value was measured with the previous parameter.
+                found, value = value, next_value(value)
+            for _ in range(options['max_steps']):
+                if name == 'memory_cost' and value > options['max_memory_mb'] * 1024:
+                    break
+                wall, cpu = self.measure(hasher, algorithm, chosen | {name: value}, options['samples'])
+                self.report(self.label(chosen | {name: value}), wall, cpu)
+                if wall > target:
+                    break
+                found, chosen_wall = value, wall
+                value = next_value(value)
+
+            if found is None:
+                self.stdout.write(self.style.WARNING(
+                    f"Ningún costo cabe en {target:.0f}ms, el mínimo es {self.label(chosen | {name: value})}"
+                ))
+                return
+            chosen[name] = found
+
+        envs = ' '.join(f'{env}={chosen[name]}' for name, env, *_ in steps)
+        self.stdout.write(self.style.SUCCESS(
+            f'PASSWORD_HASHER={algorithm} {envs} PASSWORD_HASH_MS={chosen_wall:.0f}'
+        ))
+
+    @staticmethod
+    def label(values):
+        return ' '.join(f'{name}={value}' for name, value in values.items())
+
+    def measure(self, hasher, algorithm, values, samples):
+        cost = settings.PASSWORD_HASHER_COST | {
+            algorithm: settings.PASSWORD_HASHER_COST[algorithm] | values
+        }
+        walls, cpus = [], []
+        with override_settings(PASSWORD_HASHER_COST=cost):
+            for _ in range(samples):
+                salt = hasher.salt()
+                wall, cpu = time.perf_counter(), time.process_time()
+                hasher.encode('calibration-password', salt)
+                walls.append(time.perf_counter() - wall)
+                cpus.append(time.process_time() - cpu)
+        return statistics.median(walls) * 1000, statistics.median(cpus) * 1000
+
+    def report(self, label, wall, cpu):
+        # Argon2 with parallelism > 1 uses several cores, its CPU time is the sum.
+        per_core = 1000 / cpu if cpu else float('inf')
+        self.stdout.write(
+            f'{label:40} {wall:8.1f}ms  cpu {cpu:8.1f}ms  {per_core:7.1f} logins/s por core'
+        )
@@ -0,0 +1,127 @@
+import base64
+import csv
+import itertools
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from users.models import User
+
+
+def hash_passwords(passwords):
+    return [hashers.make_password(password or None) for password in passwords]
+
+
+def random_secrets(count):
+    # 20 random bytes are exactly 32 base32 characters, like pyotp.random_base32().
+    encoded = base64.b32encode(os.urandom(20 * count)).decode()
+    return [encoded[i:i + 32] for i in range(0, len(encoded), 32)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports users from a CSV (with an 'email' and an optional 'password' "
+        "column) or JSONL file. Passwords are hashed in a process pool and the "
+        "rows are inserted with bulk_create, one transaction per batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'jsonl'), default=None)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=settings.HASHING_POOL_WORKERS)
+        parser.add_argument(
+            '--ignore-conflicts', action='store_true',
+            help="Skip emails that already exist instead of aborting the batch "
+                 "(they are reported as existing)."
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if path.endswith('.jsonl') else 'csv')
+        batch_size = options['batch_size']
+        workers = options['workers']
+        self.ignore_conflicts = options['ignore_conflicts']
+        self.imported = 0
+        self.skipped = 0
+        self.existing = 0
+        self.started_at = time.monotonic()
+
+        try:
+            f = open(path, newline='')
+        except OSError as e:
+            raise CommandError(f"No se pudo abrir el archivo: {e}")
+
+        with f:
+            rows = self.read_rows(f, file_format)
+            batches = iter(lambda: list(itertools.islice(rows, batch_size)), [])
+            if workers:
+                with ProcessPoolExecutor(workers, initializer=django.setup) as executor:
+                    self.import_batches(batches, executor, workers * 2)
+            else:
+                for batch in batches:
+                    self.insert(batch, hash_passwords([row[1] for row in batch]))
+
+        elapsed = time.monotonic() - self.started_at
+        self.stdout.write(self.style.SUCCESS(
+            f"{self.imported} usuarios importados, {self.skipped} filas omitidas, "
+            f"{self.existing} emails existentes en "
+            f"{elapsed:.1f}s ({self.imported / elapsed if elapsed else 0:.0f} filas/s)"
+        ))
+
+    def read_rows(self, f, file_format):
+        if file_format == 'jsonl':
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            records = csv.DictReader(f)
+
+        for line, record in enumerate(records, start=1):
+            email = (record.get('email') or '').strip()
+            if not email:
+                self.skipped += 1
+                self.stderr.write(f"Fila {line} sin email, se omite")
+                continue
+            yield User.objects.normalize_email(email), record.get('password')
+
+    def import_batches(self, batches, executor, max_pending):
+        # Keeps a few batches hashing ahead while the current one is inserted.
+        pending = deque()
+        for batch in batches:
+            passwords = [row[1] for row in batch]
+            pending.append((batch, executor.submit(hash_passwords, passwords)))
+            if len(pending) >= max_pending:
+                batch, future = pending.popleft()
+                self.insert(batch, future.result())
+        while pending:
+            batch, future = pending.popleft()
+            self.insert(batch, future.result())
+
+    def insert(self, batch, hashed_passwords):
+        users = [
+            User(email=email, password=password, otp_secret=secret)
+            for (email, _), password, secret in zip(batch, hashed_passwords, random_secrets(len(batch)))
+        ]
+        # bulk_create returns every object even when ignore_conflicts skipped it.
+        emails = User.objects.filter(email__in=[user.email for user in users])
+        try:
+            with transaction.atomic():
+                before = emails.count() if self.ignore_conflicts else 0
+                User.objects.bulk_create(users, ignore_conflicts=self.ignore_conflicts)
+                inserted = emails.count() - before if self.ignore_conflicts else len(users)
+        except IntegrityError as e:
+            raise CommandError(
+                f"Error al insertar el lote después de {self.imported} usuarios: {e}. "
+                "Usa --ignore-conflicts para omitir los emails existentes."
+            )
+
+        self.imported += inserted
+        self.existing += len(users) - inserted
+        elapsed = time.monotonic() - self.started_at
+        self.stdout.write(f"{self.imported} usuarios ({self.imported / elapsed:.0f} filas/s)")
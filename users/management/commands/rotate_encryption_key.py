@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Cast
+from users.models import User
+from utils.encryption import get_keyring
+
+DEFAULT_CHECKPOINT = os.path.join(tempfile.gettempdir(), 'creze_rotate_encryption_key.json')
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-encrypts the users' OTP secrets that are not on the primary key of "
+        "ENCRYPTION_KEYS. Works in batches of ascending id, one transaction "
+        "each, sleeping between batches and saving the last id to a checkpoint "
+        "file so an interrupted run continues where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--sleep', type=float, default=0.1, help="Seconds between batches.")
+        parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT)
+        parser.add_argument('--reset', action='store_true', help="Ignore the saved checkpoint.")
+
+    def handle(self, *args, **options):
+        keyring = get_keyring()
+        checkpoint = options['checkpoint']
+        last_id = 0 if options['reset'] else self.read_checkpoint(checkpoint, keyring.primary_id)
+        if last_id:
+            self.stdout.write(f"Continuando después del id {last_id}")
+
+        rotated = 0
+        started_at = time.monotonic()
+        # The annotation reads the raw ciphertext, the field itself would decrypt it.
+        users = User.objects.annotate(
+            ciphertext=Cast('otp_secret', models.CharField(max_length=255))
+        ).exclude(otp_secret__isnull=True).order_by('id')
+
+        while True:
+            batch = list(users.filter(id__gt=last_id).values_list('id', 'ciphertext')[:options['batch_size']])
+            if not batch:
+                break
+
+            with transaction.atomic():
+                for user_id, ciphertext in batch:
+                    if not keyring.needs_rotation(ciphertext):
+                        continue
+                    # Only if the secret didn't change since it was read.
+                    rotated += User.objects.filter(id=user_id, otp_secret=Value(ciphertext)).update(
+                        otp_secret=keyring.decrypt(ciphertext)
+                    )
+
+            last_id = batch[-1][0]
+            self.write_checkpoint(checkpoint, keyring.primary_id, last_id)
+            self.stdout.write(f"Hasta el id {last_id}, {rotated} secretos re-cifrados")
+            time.sleep(options['sleep'])
+
+        self.write_checkpoint(checkpoint, keyring.primary_id, last_id)
+        elapsed = time.monotonic() - started_at
+        self.stdout.write(self.style.SUCCESS(
+            f"{rotated} secretos re-cifrados con la llave '{keyring.primary_id}' en {elapsed:.1f}s"
+        ))
+
+    def read_checkpoint(self, path, primary_id):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        # A checkpoint of a rotation to another key is useless.
+        return data['last_id'] if data.get('primary_id') == primary_id else 0
+
+    def write_checkpoint(self, path, primary_id, last_id):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'primary_id': primary_id, 'last_id': last_id}, f)
+        os.replace(tmp_path, path)
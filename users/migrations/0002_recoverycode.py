@@ -0,0 +1,60 @@
+# Generated by Django 4.2.4 on 2026-10-18 15:35
+
+import json
+
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.crypto import salted_hmac
+import django.db.models.deletion
+
+
+def hash_recovery_codes(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    RecoveryCode = apps.get_model('users', 'RecoveryCode')
+    cipher = Fernet(settings.ENCRYPTION_KEY)
+
+    users = User.objects.exclude(legacy_recovery_codes__isnull=True).exclude(legacy_recovery_codes='')
+    for user_id, encrypted_codes in users.values_list('id', 'legacy_recovery_codes').iterator():
+        codes = json.loads(cipher.decrypt(encrypted_codes.encode()).decode())
+        RecoveryCode.objects.bulk_create(
+            RecoveryCode(
+                user_id=user_id,
+                code_hash=salted_hmac(
+                    'users.RecoveryCode', f'{user_id}:{code}', algorithm='sha256'
+                ).hexdigest()
+            )
+            for code in set(codes)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='user',
+            old_name='recovery_codes',
+            new_name='legacy_recovery_codes',
+        ),
+        migrations.CreateModel(
+            name='RecoveryCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code_hash', models.CharField(max_length=64)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recovery_codes', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='recoverycode',
+            constraint=models.UniqueConstraint(fields=('user', 'code_hash'), name='users_recoverycode_user_code_hash'),
+        ),
+        migrations.RunPython(hash_recovery_codes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='user',
+            name='legacy_recovery_codes',
+        ),
+    ]
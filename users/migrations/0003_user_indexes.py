@@ -0,0 +1,21 @@
+# Generated by Django 4.2.4 on 2026-10-18 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_recoverycode'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_active', 'otp_activated', 'id'], name='users_user_active_otp_id'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_staff', 'is_superuser', 'id'], name='users_user_staff_super_id'),
+        ),
+    ]
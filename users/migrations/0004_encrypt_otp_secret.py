@@ -0,0 +1,42 @@
+# Generated by Django 4.2.4 on 2026-10-18 15:54
+
+from django.db import migrations, models
+import utils.encryption
+
+
+def encrypt_otp_secrets(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    keyring = utils.encryption.get_keyring()
+    users = User.objects.exclude(otp_secret__isnull=True).values_list('id', 'otp_secret')
+    for user_id, secret in users.iterator():
+        if keyring.key_id(secret) is None:
+            User.objects.filter(id=user_id).update(otp_secret=keyring.encrypt(secret))
+
+
+def decrypt_otp_secrets(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    keyring = utils.encryption.get_keyring()
+    users = User.objects.exclude(otp_secret__isnull=True).values_list('id', 'otp_secret')
+    for user_id, secret in users.iterator():
+        User.objects.filter(id=user_id).update(otp_secret=keyring.decrypt(secret))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='otp_secret',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.RunPython(encrypt_otp_secrets, decrypt_otp_secrets),
+        migrations.AlterField(
+            model_name='user',
+            name='otp_secret',
+            field=utils.encryption.EncryptedCharField(blank=True, max_length=255, null=True),
+        ),
+    ]
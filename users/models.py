@@ -1,11 +1,16 @@
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.models import PermissionsMixin
-from django.db import models
-from cryptography.fernet import Fernet
-import json
-
-cipher = Fernet(settings.ENCRYPTION_KEY)
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, models, transaction
+from django.utils.crypto import salted_hmac
+from utils import hashing
+from utils.common_functions import send_email
+from utils.db_router import replicas
+from utils.encryption import EncryptedCharField
+from .cache import user_cache
+from .provisioning import provisioning_cache
+import pyotp
 
 
 class UserManager(BaseUserManager):
@@ -17,6 +22,72 @@ class UserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+    def get_by_natural_key(self, username):
+        # Logins right after an MFA change must not see the replica's old row.
+        if replicas.pinned(f'user-email:{username}'):
+            using = DEFAULT_DB_ALIAS
+        else:
+            using = self.db
+        try:
+            return self.db_manager(using).get(**{self.model.USERNAME_FIELD: username})
+        except self.model.DoesNotExist:
+            if using == DEFAULT_DB_ALIAS:
+                raise
+            # A user who just signed up may not be on the replica yet.
+            return self.db_manager(DEFAULT_DB_ALIAS).get_by_natural_key(username)
+
+    async def aget_by_natural_key(self, username):
+        # The alias is left to the router, its lag check queries and has to
+        # run in aget's thread.
+        pinned = await replicas.apinned(f'user-email:{username}')
+        manager = self.db_manager(DEFAULT_DB_ALIAS) if pinned else self
+        lookup = {self.model.USERNAME_FIELD: username}
+        try:
+            return await manager.aget(**lookup)
+        except self.model.DoesNotExist:
+            if pinned or not settings.DATABASE_REPLICAS:
+                raise
+            return await self.db_manager(DEFAULT_DB_ALIAS).aget(**lookup)
+
+    def signup(self, email, encoded_password):
+        """
+        Inserts a user from the signup, None when the email is taken. The
+        unique index rejects it, the welcome email goes out after commit.
+        """
+        try:
+            with transaction.atomic(using=self._db):
+                user = self.create(email=email, password=encoded_password)
+                transaction.on_commit(send_email, using=self._db)
+        except IntegrityError:
+            return None
+        return user
+
+    def bulk_signup(self, users):
+        """
+        Creates the (email, password) pairs whose email is free and returns
+        (created, taken) emails. Taken emails are found with one query on
+        the unique index before hashing, the rest are hashed in the pool
+        and inserted skipping conflicts. A row counts as created only if
+        it holds the hash computed here.
+        """
+        emails = [email for email, _ in users]
+        taken = set(self.filter(email__in=emails).values_list('email', flat=True))
+        new = [(email, password) for email, password in users if email not in taken]
+        encoded = hashing.make_passwords([password for _, password in new])
+
+        with transaction.atomic(using=self._db):
+            self.bulk_create(
+                [self.model(email=email, password=password) for (email, _), password in zip(new, encoded)],
+                ignore_conflicts=True,
+            )
+            stored = dict(self.filter(email__in=[email for email, _ in new]).values_list('email', 'password'))
+            created = [email for (email, _), password in zip(new, encoded) if stored.get(email) == password]
+            for _ in created:
+                transaction.on_commit(send_email, using=self._db)
+
+        created_set = set(created)
+        return created, [email for email in emails if email not in created_set]
+
     def create_superuser(self, email, **extra_fields):
         extra_fields.setdefault("is_active", True)
         extra_fields.setdefault("is_staff", True)
@@ -26,8 +97,7 @@ class UserManager(BaseUserManager):
 
 class User(AbstractBaseUser, PermissionsMixin):
     email = models.EmailField(unique=True)
-    otp_secret = models.CharField(max_length=64, blank=True, null=True)
-    recovery_codes = models.TextField(null=True, blank=True)
+    otp_secret = EncryptedCharField(max_length=255, blank=True, null=True)
     otp_activated = models.BooleanField(default=True)
     otp_verified = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
@@ -39,22 +109,120 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
+    class Meta:
+        # Admin filters and the keyset pagination of the user list, "id" last
+        # so a filtered page is an index range scan.
+        indexes = [
+            models.Index(fields=['is_active', 'otp_activated', 'id'], name='users_user_active_otp_id'),
+            models.Index(fields=['is_staff', 'is_superuser', 'id'], name='users_user_staff_super_id'),
+        ]
+
+    def set_password(self, raw_password):
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        is_correct = hashing.check_password(raw_password, self.password)
+        if is_correct and hashing.must_update(self.password):
+            hashing.password_upgrader.enqueue(self.pk, raw_password, self.password)
+        return is_correct
+
+    async def aset_password(self, raw_password):
+        self.password = await hashing.amake_password(raw_password)
+        self._password = raw_password
+
+    async def acheck_password(self, raw_password):
+        is_correct = await hashing.acheck_password(raw_password, self.password)
+        if is_correct and hashing.must_update(self.password):
+            hashing.password_upgrader.enqueue(self.pk, raw_password, self.password)
+        return is_correct
+
+    def transition(self, expected, **changes):
+        updated = User.objects.filter(pk=self.pk, **expected).update(**changes)
+        if updated:
+            self._changed(changes)
+        return bool(updated)
+
+    async def atransition(self, expected, **changes):
+        updated = await User.objects.filter(pk=self.pk, **expected).aupdate(**changes)
+        if updated:
+            await sync_to_async(self._changed)(changes)
+        return bool(updated)
+
+    def _changed(self, changes):
+        for field, value in changes.items():
+            setattr(self, field, value)
+        user_cache.invalidate(self.pk, self.email)
+        if 'otp_secret' in changes:
+            provisioning_cache.invalidate(self.pk)
+
+    def mark_otp_verified(self):
+        with transaction.atomic():
+            first_validation = self.transition({'otp_verified': False}, otp_verified=True)
+            if first_validation and not self.recovery_codes.exists():
+                return self.generate_recovery_codes()
+
+    def disable_otp(self, recovery_code):
+        with transaction.atomic():
+            if not self.verify_recovery_code(recovery_code):
+                return False
+            changes = {'otp_secret': None, 'otp_activated': False, 'otp_verified': False}
+            if not self.transition({'otp_activated': True}, **changes):
+                transaction.set_rollback(True)
+                return False
+        return True
+
+    def provision_otp_secret(self):
+        """The secret is created on the first MFA setup instead of at signup."""
+        if not self.transition({'otp_secret': None}, otp_secret=pyotp.random_base32()):
+            self.refresh_from_db(fields=['otp_secret'])
+        return self.otp_secret
+
+    async def aprovision_otp_secret(self):
+        if not await self.atransition({'otp_secret': None}, otp_secret=pyotp.random_base32()):
+            await self.arefresh_from_db(fields=['otp_secret'])
+        return self.otp_secret
+
+    def activate_otp(self):
+        changes = {'otp_secret': pyotp.random_base32(), 'otp_activated': True}
+        return self.transition({'otp_activated': False}, **changes)
+
+    async def aactivate_otp(self):
+        changes = {'otp_secret': pyotp.random_base32(), 'otp_activated': True}
+        return await self.atransition({'otp_activated': False}, **changes)
+
     def generate_recovery_codes(self):
         recovery_codes = [User.objects.make_random_password() for _ in range(10)]
-        encrypted_codes = cipher.encrypt(json.dumps(recovery_codes).encode())
-        self.recovery_codes = encrypted_codes.decode()
-        self.save()
+        with transaction.atomic():
+            self.recovery_codes.all().delete()
+            RecoveryCode.objects.bulk_create(
+                RecoveryCode(user=self, code_hash=RecoveryCode.hash_code(self.pk, code))
+                for code in recovery_codes
+            )
         return recovery_codes
 
     def verify_recovery_code(self, code):
-        if self.recovery_codes:
-            decrypted_codes = cipher.decrypt(self.recovery_codes.encode()).decode()
-            recovery_codes = json.loads(decrypted_codes)
+        code_hash = RecoveryCode.hash_code(self.pk, code)
+        deleted, _ = RecoveryCode.objects.filter(user=self, code_hash=code_hash).delete()
+        return deleted > 0
+
+
+class RecoveryCode(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recovery_codes')
+    code_hash = models.CharField(max_length=64)
 
-            if code in recovery_codes:
-                recovery_codes.remove(code)
-                self.recovery_codes = cipher.encrypt(json.dumps(recovery_codes).encode()).decode()
-                self.save()
-                return True
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'code_hash'], name='users_recoverycode_user_code_hash'
+            )
+        ]
 
-        return False
+    @staticmethod
+    def hash_code(user_id, code):
+        # Keyed with SECRET_KEY and salted with the user id, so equal codes of
+        # different users never share a hash and the lookup stays indexed.
+        # Rotating SECRET_KEY invalidates every stored code, the lookup only
+        # hashes with the current key so SECRET_KEY_FALLBACKS doesn't help.
+        value = f'{user_id}:{code}'
+        return salted_hmac('users.RecoveryCode', value, algorithm='sha256').hexdigest()
@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class UserCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the primary key, every page is a "WHERE id < X"
+    range scan instead of an OFFSET, so deep pages cost the same as the first.
+    """
+
+    ordering = '-id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
@@ -0,0 +1,109 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+import pyotp
+from django.conf import settings
+from django.utils.http import parse_etags
+
+
+class ProvisioningCache:
+    """
+    Per-process cache of each user's MFA provisioning URI and of its QR
+    renders. Entries are tagged with a fingerprint of the secret, the email
+    and the issuer, which is also the response's ETag, so a user whose secret
+    changed in another worker is a miss here too without any message
+    between workers.
+    """
+
+    content_types = {'svg': 'image/svg+xml', 'png': 'image/png'}
+
+    def __init__(self, max_size=10000, max_renders=1000):
+        self.max_size = max_size
+        self.max_renders = max_renders
+        self._uris = OrderedDict()
+        self._renders = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(secret, email, issuer):
+        return hashlib.sha256(f'{secret}\0{email}\0{issuer}'.encode()).hexdigest()[:32]
+
+    def user_fingerprint(self, user):
+        return self.fingerprint(user.otp_secret, user.email, settings.ISSUER_NAME)
+
+    def _store(self, entries, key, value, max_size):
+        with self._lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > max_size:
+                entries.popitem(last=False)
+
+    def uri(self, user):
+        """Returns (fingerprint, provisioning URI) of the user's current secret."""
+        fingerprint = self.user_fingerprint(user)
+        with self._lock:
+            entry = self._uris.get(user.pk)
+            if entry is not None and entry[0] == fingerprint:
+                self._uris.move_to_end(user.pk)
+                return entry
+
+        uri = pyotp.totp.TOTP(user.otp_secret).provisioning_uri(
+            name=user.email, issuer_name=settings.ISSUER_NAME
+        )
+        self._store(self._uris, user.pk, (fingerprint, uri), self.max_size)
+        return fingerprint, uri
+
+    def qr(self, user, image_format):
+        """Returns (fingerprint, QR image bytes) in "svg" or "png"."""
+        fingerprint, uri = self.uri(user)
+        key = (fingerprint, image_format)
+        with self._lock:
+            image = self._renders.get(key)
+            if image is not None:
+                self._renders.move_to_end(key)
+                return fingerprint, image
+
+        image = self.render(uri, image_format)
+        self._store(self._renders, key, image, self.max_renders)
+        return fingerprint, image
+
+    @staticmethod
+    def render(uri, image_format):
+        # Imported here, only the onboarding screens ask for a QR.
+        import qrcode
+
+        if image_format == 'svg':
+            from qrcode.image.svg import SvgPathImage as image_factory
+        else:
+            from qrcode.image.pure import PyPNGImage as image_factory
+        buffer = io.BytesIO()
+        qrcode.make(uri, image_factory=image_factory).save(buffer)
+        return buffer.getvalue()
+
+    def invalidate(self, user_id):
+        with self._lock:
+            entry = self._uris.pop(user_id, None)
+            if entry is not None:
+                for image_format in self.content_types:
+                    self._renders.pop((entry[0], image_format), None)
+
+    def clear(self):
+        with self._lock:
+            self._uris.clear()
+            self._renders.clear()
+
+
+def etag(fingerprint, image_format=None):
+    return f'"{fingerprint}-{image_format}"' if image_format else f'"{fingerprint}"'
+
+
+def not_modified(request, tag):
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return tag in etags or '*' in etags
+
+
+provisioning_cache = ProvisioningCache(
+    max_size=settings.USER_CACHE_SIZE, max_renders=settings.QR_CACHE_SIZE
+)
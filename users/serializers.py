@@ -1,6 +1,9 @@
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 from .models import User
-from utils.custom_serializers import CustomCharField
+from utils import hashing
+from utils.custom_serializers import CustomCharField, FastSerializer
 
 
 class PasswordSerializer(serializers.Serializer):
@@ -13,22 +16,58 @@ class LoginSerializer(PasswordSerializer):
     email = serializers.EmailField(max_length=80)
 
 
+EMAIL_TAKEN = 'Ya existe un usuario con este correo'
+
+
 class UserSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = User
         fields = ['email', 'password']
-        extra_kwargs = {'password': {'write_only': True}}
+        extra_kwargs = {
+            'email': {'validators': [UniqueValidator(User.objects.all(), EMAIL_TAKEN)]},
+            'password': {'write_only': True},
+        }
+
+
+class SignupItemSerializer(serializers.Serializer):
+
+    email = serializers.EmailField(max_length=254)
+    password = serializers.CharField(max_length=128)
+
+
+class BulkSignupSerializer(serializers.Serializer):
+
+    users = SignupItemSerializer(many=True, allow_empty=False, max_length=settings.SIGNUP_BULK_MAX_SIZE)
+
+    def validate_users(self, users):
+        emails = [user['email'] for user in users]
+        if len(set(emails)) != len(emails):
+            raise serializers.ValidationError('Hay correos repetidos')
+        max_size = hashing.max_batch_size()
+        if len(users) > max_size:
+            raise serializers.ValidationError(f'Se aceptan como máximo {max_size} usuarios por petición')
+        return users
+
+
+class UserListSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = User
+        fields = [
+            'id', 'email', 'is_active', 'otp_activated', 'otp_verified',
+            'is_staff', 'is_superuser'
+        ]
 
 
-class MFAValidateSerializer(serializers.Serializer):
+class MFAValidateSerializer(FastSerializer):
 
     code = CustomCharField(validate_regex={
         'regex': r'^\d{6}$', 'error_message': 'Código incompatible'
     })
 
 
-class MFADisableSerializer(serializers.Serializer):
+class MFADisableSerializer(FastSerializer):
 
     code = CustomCharField(validate_regex={
         'regex': r'^.{10}$', 'error_message': 'Código incompatible'
@@ -1,16 +1,63 @@
-from rest_framework.test import APITestCase
+from asgiref.sync import sync_to_async
+from rest_framework.test import APITestCase, APITransactionTestCase
+from cryptography.fernet import Fernet, InvalidToken
 from rest_framework import status
 from unittest.mock import patch
 from django.urls import reverse
+from django.db import OperationalError, connection, connections, router
+from django.db.models import QuerySet
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.signals import request_started
+from django.test import AsyncClient, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework import serializers
+from users.cache import user_cache
+from users.lockout import LoginLockout
+from users.provisioning import provisioning_cache
+from users.serializers import MFAValidateSerializer
+from users.totp import TOTPVerifier
+from utils.aws import SecretsCache
+from utils.custom_serializers import CustomCharField
+from utils.db_router import Replicas, replicas
+from utils.encryption import Keyring
+from utils.db_pool.pool import ConnectionPool, PoolTimeout
+from utils.fast_json import FastJSONParser, FastJSONRenderer, orjson
+from utils.email_outbox import EmailOutbox, InMemoryBackend, get_outbox
+from utils import hashing
+from utils.hashers import PBKDF2PasswordHasher, ScryptPasswordHasher
+from utils.hashing import HashingPool, must_update, password_upgrader
+from utils.metrics import Registry, render
+from utils.throttling import ScopedRateThrottle
+from datetime import datetime, timezone
+from decimal import Decimal
+from django.utils.translation import gettext_lazy as _
+from io import BytesIO, StringIO
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+import asyncio
+import csv
+import gzip
+import json
+import os
 import pyotp
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
 
 User = get_user_model()
 
 class LoginViewTest(APITestCase):
 
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(
             email="testuser@example.com",
             password="securepassword123"
@@ -65,9 +112,24 @@ class LoginViewTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('password', response.data)
 
+    def test_login_hashing_pool_busy(self):
+        pool = HashingPool(max_workers=1, max_pending=1)
+        _, slots = pool._get_executor()
+        slots.acquire()
+        data = {
+            "email": "testuser@example.com",
+            "password": "securepassword123"
+        }
+        with patch('utils.hashing.hashing_pool', pool):
+            response = self.client.post(self.login_url, data, format='json')
+        slots.release()
+        pool.shutdown()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
 class SignInViewTests(APITestCase):
 
     def setUp(self):
+        InMemoryBackend.sent.clear()
         self.url = reverse('signup')
 
     @patch('utils.common_functions.send_email')
@@ -80,6 +142,17 @@ class SignInViewTests(APITestCase):
         response = self.client.post(self.url, data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_signup_enqueues_email(self):
+        data = {
+            'email': 'queued@test.com',
+            'password': 'password123'
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(get_outbox().flush(timeout=5))
+        self.assertEqual(len(InMemoryBackend.sent), 1)
+
     @patch('utils.common_functions.send_email')
     def test_signup_duplicate_user(self, mock_send_email):
         User.objects.create_user(
@@ -101,6 +174,883 @@ class SignInViewTests(APITestCase):
         response = self.client.post(self.url, data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_signup_duplicate_skips_hashing(self):
+        User.objects.create_user(email='duplicate@example.com', password='DuplicatePassword123')
+        data = {'email': 'duplicate@example.com', 'password': 'password123'}
+        with patch('utils.hashing.make_password') as make_password:
+            response = self.client.post(self.url, data)
+        make_password.assert_not_called()
+        self.assertEqual(response.data['email'], ['Ya existe un usuario con este correo'])
+
+    def test_signup_race_is_bad_request(self):
+        User.objects.create_user(email='race@example.com', password='password123')
+        data = {'email': 'race@example.com', 'password': 'password123'}
+        with patch('rest_framework.validators.UniqueValidator.__call__'), \
+                self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['email'], ['Ya existe un usuario con este correo'])
+        self.assertEqual(callbacks, [])
+
+    def test_signup_defers_otp_secret(self):
+        self.client.post(self.url, {'email': 'deferred@test.com', 'password': 'password123'})
+        user = User.objects.get(email='deferred@test.com')
+        self.assertIsNone(user.otp_secret)
+
+        token = str(RefreshToken.for_user(user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer { token }')
+        response = self.client.get(reverse('mfa-setup'))
+        user.refresh_from_db()
+        self.assertEqual(len(user.otp_secret), 32)
+        self.assertIn(user.otp_secret, response.data['otp_uri'])
+
+
+class BulkSignupViewTests(APITestCase):
+
+    def setUp(self):
+        InMemoryBackend.sent.clear()
+        admin = User.objects.create_superuser(email='admin@example.com', password='securepassword123')
+        token = str(RefreshToken.for_user(admin).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer { token }')
+        self.url = reverse('signup-bulk')
+
+    def test_bulk_signup(self):
+        users = [
+            {'email': 'partner1@example.com', 'password': 'password123'},
+            {'email': 'admin@example.com', 'password': 'password123'},
+            {'email': 'partner2@example.com', 'password': 'password456'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'users': users}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {
+            'created': ['partner1@example.com', 'partner2@example.com'],
+            'taken': ['admin@example.com'],
+        })
+        self.assertTrue(User.objects.get(email='partner2@example.com').check_password('password456'))
+        self.assertTrue(get_outbox().flush(timeout=5))
+        self.assertEqual(len(InMemoryBackend.sent), 2)
+
+    def test_bulk_signup_lost_race(self):
+        users = [('partner1@example.com', 'password123'), ('partner2@example.com', 'password123')]
+        make_passwords = hashing.make_passwords
+
+        def concurrent_signup(passwords):
+            User.objects.create_user(email='partner2@example.com', password='otherpassword')
+            return make_passwords(passwords)
+
+        with patch('utils.hashing.make_passwords', concurrent_signup):
+            created, taken = User.objects.bulk_signup(users)
+        self.assertEqual(created, ['partner1@example.com'])
+        self.assertEqual(taken, ['partner2@example.com'])
+        self.assertTrue(User.objects.get(email='partner2@example.com').check_password('otherpassword'))
+
+    def test_bulk_signup_validation(self):
+        users = [{'email': 'partner@example.com', 'password': 'password123'}] * 2
+        response = self.client.post(self.url, {'users': users}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['users'], ['Hay correos repetidos'])
+
+        users = [{'email': f'partner{i}@example.com', 'password': 'password123'} for i in range(101)]
+        response = self.client.post(self.url, {'users': users}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_signup_full_batch(self):
+        # The configured hasher and pool, with a shorter timeout to keep the test quick.
+        with patch.object(hashing.hashing_pool, 'timeout', 2):
+            max_size = hashing.max_batch_size()
+            users = [{'email': f'partner{i}@example.com', 'password': 'password123'} for i in range(max_size)]
+            started = time.monotonic()
+            response = self.client.post(self.url, {'users': users}, format='json')
+            elapsed = time.monotonic() - started
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(len(response.data['created']), max_size)
+            self.assertLess(elapsed, 2)
+
+            users.append({'email': 'partner@example.com', 'password': 'password123'})
+            response = self.client.post(self.url, {'users': users}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(
+                response.data['users'], [f'Se aceptan como máximo {max_size} usuarios por petición']
+            )
+
+    def test_hash_cost_measured_in_the_pool(self):
+        with patch.dict(hashing._hash_seconds, clear=True), override_settings(PASSWORD_HASH_MS=0):
+            with patch.object(hashing.hashing_pool, 'run', return_value=0.05) as run:
+                self.assertEqual(hashing.hash_seconds(), 0.05)
+                self.assertEqual(hashing.hash_seconds(), 0.05)
+            run.assert_called_once_with(hashing._time_hash)
+
+            hashing._hash_seconds.clear()
+            hashing.measure_hash_seconds()
+            with patch.object(hashing.hashing_pool, 'run') as run:
+                self.assertGreater(hashing.hash_seconds(), 0)
+            run.assert_not_called()
+
+    def test_bulk_signup_requires_admin(self):
+        user = User.objects.create_user(email='partner@example.com', password='password123')
+        token = str(RefreshToken.for_user(user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer { token }')
+        response = self.client.post(self.url, {'users': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class FlakyBackend:
+
+    calls = 0
+
+    def __init__(self, **kwargs):
+        pass
+
+    def send_messages(self, messages):
+        FlakyBackend.calls += 1
+        if FlakyBackend.calls == 1:
+            raise ConnectionError()
+        return []
+
+
+class EmailOutboxTests(APITestCase):
+
+    def test_batches_and_retries(self):
+        outbox = EmailOutbox(FlakyBackend, batch_size=5, retry_backoff=0)
+        outbox.queue.put({'to_address': 'a@example.com'})
+        outbox.queue.put({'to_address': 'b@example.com'})
+        outbox.queue.put({'to_address': 'c@example.com'})
+        outbox._ensure_dispatcher()
+        self.assertTrue(outbox.flush(timeout=5))
+        self.assertEqual(FlakyBackend.calls, 2)
+        self.assertEqual(outbox.stats(), {'depth': 0, 'sent': 3, 'failed': 0, 'dropped': 0})
+
+    def test_full_queue_drops_message(self):
+        outbox = EmailOutbox(InMemoryBackend, max_size=1)
+        outbox.queue.put({'to_address': 'a@example.com'})
+        outbox._pid = os.getpid()
+        self.assertFalse(outbox.enqueue({'to_address': 'b@example.com'}))
+        self.assertEqual(outbox.stats()['dropped'], 1)
+
+
+class SecretsCacheTests(APITestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'secrets.json')
+
+    def test_value_is_cached_and_written_to_disk(self):
+        cache = SecretsCache('creze', ttl=60, fallback_path=self.path)
+        with patch.object(SecretsCache, '_fetch', return_value={'KEY': 'value'}) as fetch:
+            self.assertEqual(cache.get(), {'KEY': 'value'})
+            self.assertEqual(cache.get(), {'KEY': 'value'})
+        self.assertEqual(fetch.call_count, 1)
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {'KEY': 'value'})
+
+    def test_fresh_file_skips_fetch(self):
+        with open(self.path, 'w') as f:
+            json.dump({'KEY': 'disk'}, f)
+        cache = SecretsCache('creze', ttl=60, fallback_path=self.path)
+        with patch.object(SecretsCache, '_fetch') as fetch:
+            self.assertEqual(cache.get(), {'KEY': 'disk'})
+        fetch.assert_not_called()
+
+    def test_stale_file_is_used_when_fetch_fails(self):
+        with open(self.path, 'w') as f:
+            json.dump({'KEY': 'disk'}, f)
+        os.utime(self.path, (0, 0))
+        cache = SecretsCache('creze', ttl=60, fallback_path=self.path)
+        with patch.object(SecretsCache, '_fetch', side_effect=ConnectionError()):
+            self.assertEqual(cache.get(), {'KEY': 'disk'})
+
+    def test_fetch_error_without_fallback_raises(self):
+        cache = SecretsCache('creze', ttl=60)
+        with patch.object(SecretsCache, '_fetch', side_effect=ConnectionError()):
+            with self.assertRaises(ConnectionError):
+                cache.get()
+
+
+class LoginThrottle(ScopedRateThrottle):
+
+    THROTTLE_RATES = {'login': '2/minute'}
+
+
+class HashingPoolTests(APITestCase):
+
+    def make_pool(self, timeout, max_pending=1):
+        pool = HashingPool(max_workers=1, max_pending=max_pending)
+        # Warmed without a timeout, the forkserver takes a while to start.
+        pool.run(time.sleep, 0)
+        pool.timeout = timeout
+        self.addCleanup(pool.shutdown)
+        return pool
+
+    async def test_async_callers_wait_for_a_slot(self):
+        pool = await sync_to_async(self.make_pool)(5)
+        results = await asyncio.gather(*[pool.arun(time.sleep, 0.1) for _ in range(3)])
+        self.assertEqual(results, [None, None, None])
+
+    async def test_async_wait_bounded_by_timeout(self):
+        pool = await sync_to_async(self.make_pool)(0.3)
+        results = await asyncio.gather(
+            pool.arun(time.sleep, 0.2), pool.arun(time.sleep, 0.2), return_exceptions=True
+        )
+        self.assertIsNone(results[0])
+        self.assertIsInstance(results[1], hashing.HashingPoolBusy)
+
+    def test_timed_out_hash_keeps_its_slot(self):
+        pool = self.make_pool(0.1)
+        with self.assertRaises(hashing.HashingPoolBusy):
+            pool.run(time.sleep, 0.5)
+        with self.assertRaises(hashing.HashingPoolBusy):
+            pool.run(time.sleep, 0)
+        time.sleep(0.6)
+        self.assertIsNone(pool.run(time.sleep, 0))
+
+    def test_batch_bounded_by_one_timeout(self):
+        pool = self.make_pool(0.3, max_pending=3)
+        start = time.monotonic()
+        with self.assertRaises(hashing.HashingPoolBusy):
+            pool.run_many(time.sleep, [(0.2,), (0.2,), (0.2,)])
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    async def test_async_timed_out_hash_keeps_its_slot(self):
+        pool = await sync_to_async(self.make_pool)(0.1)
+        with self.assertRaises(hashing.HashingPoolBusy):
+            await pool.arun(time.sleep, 0.5)
+        with self.assertRaises(hashing.HashingPoolBusy):
+            await pool.arun(time.sleep, 0)
+        await asyncio.sleep(0.6)
+        self.assertIsNone(await pool.arun(time.sleep, 0))
+
+
+GEVENT_WORKER = """
+from gevent import monkey
+monkey.patch_all()
+from psycogreen.gevent import patch_psycopg
+patch_psycopg()
+import django
+django.setup()
+import gevent
+from django.contrib.auth import hashers
+from utils.hashing import HashingPool
+pool = HashingPool(max_workers=1, max_pending=3, timeout=20)
+jobs = [gevent.spawn(pool.run, hashers.make_password, f'password{i}') for i in range(3)]
+gevent.joinall(jobs, raise_error=True)
+print(all(hashers.check_password(f'password{i}', job.value) for i, job in enumerate(jobs)))
+pool.shutdown()
+"""
+
+
+class GeventHashingPoolTests(APITestCase):
+
+    def test_greenlets_share_the_pool(self):
+        # Like a gevent worker of config/gunicorn/conf.py, patched before django is imported.
+        result = subprocess.run(
+            [sys.executable, '-c', GEVENT_WORKER], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            timeout=60, env=os.environ | {'DJANGO_SETTINGS_MODULE': 'creze_api.settings'},
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), 'True')
+
+
+class PasswordHasherTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='hasher@example.com', password='securepassword123')
+
+    def scrypt_cost(self, work_factor):
+        cost = settings.PASSWORD_HASHER_COST
+        return cost | {'scrypt': cost['scrypt'] | {'work_factor': work_factor}}
+
+    def test_scrypt_cost_from_settings(self):
+        with override_settings(PASSWORD_HASHER_COST=self.scrypt_cost(2 ** 10)):
+            encoded = ScryptPasswordHasher().encode('securepassword123', 'salt')
+            self.assertTrue(encoded.startswith('scrypt$1024$'))
+            self.assertFalse(must_update(encoded))
+        self.assertTrue(must_update(encoded))
+        self.assertTrue(ScryptPasswordHasher().verify('securepassword123', encoded))
+
+    def test_old_hasher_must_update(self):
+        encoded = PBKDF2PasswordHasher().encode('securepassword123', 'salt', iterations=1000)
+        self.assertTrue(must_update(encoded))
+
+    def test_upgrade_deferred_on_login(self):
+        old = PBKDF2PasswordHasher().encode('securepassword123', 'salt', iterations=1000)
+        User.objects.filter(pk=self.user.pk).update(password=old)
+        data = {'email': 'hasher@example.com', 'password': 'securepassword123'}
+        with patch.object(password_upgrader, 'enqueue') as enqueue, CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('login'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        enqueue.assert_called_once_with(self.user.pk, 'securepassword123', old)
+        self.assertFalse(any(query['sql'].startswith('UPDATE') for query in queries))
+
+        self.assertTrue(password_upgrader.upgrade(self.user.pk, 'securepassword123', old))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('scrypt$'))
+        self.assertTrue(self.user.check_password('securepassword123'))
+
+    def test_upgrade_skipped_if_password_changed(self):
+        old = self.user.password
+        self.user.set_password('otherpassword123')
+        self.user.save()
+        self.assertFalse(password_upgrader.upgrade(self.user.pk, 'securepassword123', old))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('otherpassword123'))
+
+    def test_calibrate_hasher(self):
+        out = StringIO()
+        call_command('calibrate_hasher', algorithm='scrypt', target_ms=10000, samples=1, max_steps=1, stdout=out)
+        self.assertIn('logins/s por core', out.getvalue())
+        self.assertIn('SCRYPT_WORK_FACTOR=4096', out.getvalue())
+        self.assertIn('PASSWORD_HASH_MS=', out.getvalue())
+
+    def test_calibrate_argon2_memory_and_time(self):
+        out = StringIO()
+        call_command(
+            'calibrate_hasher', algorithm='argon2', target_ms=10000, samples=1, max_steps=2,
+            max_memory_mb=32, stdout=out,
+        )
+        self.assertIn('memory_cost=32768 time_cost=3', out.getvalue())
+        self.assertIn('ARGON2_MEMORY_COST=32768 ARGON2_TIME_COST=3 PASSWORD_HASH_MS=', out.getvalue())
+
+
+class LoginLockoutTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='locked@example.com', password='securepassword123')
+        self.lockout = LoginLockout(threshold=3, ip_threshold=5, base=60, max_lockout=300)
+        self.lockout.timer = lambda: 1000
+
+    def fail(self, times, email='locked@example.com', ip='10.0.0.1'):
+        for _ in range(times):
+            self.lockout.failed(email, ip)
+
+    def test_locks_after_threshold(self):
+        self.fail(2)
+        self.assertEqual(self.lockout.locked('locked@example.com', '10.0.0.2'), 0)
+        self.fail(1)
+        self.assertEqual(self.lockout.locked('Locked@Example.com ', '10.0.0.2'), 60)
+        self.lockout.timer = lambda: 1045
+        self.assertEqual(self.lockout.locked('locked@example.com', '10.0.0.2'), 15)
+
+    def test_lockout_doubles_up_to_max(self):
+        self.fail(4)
+        self.assertEqual(self.lockout.locked('locked@example.com', None), 120)
+        self.fail(3)
+        self.assertEqual(self.lockout.locked('locked@example.com', None), 300)
+
+    def test_ip_locked_across_emails(self):
+        for i in range(5):
+            self.fail(1, email=f'user{i}@example.com')
+        self.assertEqual(self.lockout.locked('other@example.com', '10.0.0.1'), 60)
+        self.assertEqual(self.lockout.locked('other@example.com', '10.0.0.2'), 0)
+
+    def test_ip_lockout_ignores_spoofed_forwarded_for(self):
+        data = {'email': 'locked@example.com', 'password': 'wrongpassword'}
+        with patch('users.views.login_lockout', self.lockout):
+            for i in range(5):
+                response = self.client.post(
+                    reverse('login'), data | {'email': f'user{i}@example.com'}, format='json',
+                    REMOTE_ADDR='172.18.0.5', HTTP_X_FORWARDED_FOR=f'10.9.9.{i}, 203.0.113.7',
+                )
+                self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            response = self.client.post(
+                reverse('login'), data | {'email': 'other@example.com'}, format='json',
+                REMOTE_ADDR='172.18.0.5', HTTP_X_FORWARDED_FOR='10.9.9.99, 203.0.113.7',
+            )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.lockout.locked('other@example.com', '203.0.113.7'), 60)
+
+    def test_success_resets_email_counter(self):
+        self.fail(2)
+        self.lockout.succeeded('locked@example.com')
+        self.fail(2)
+        self.assertEqual(self.lockout.locked('locked@example.com', None), 0)
+
+    def test_locked_login_skips_authenticate(self):
+        data = {'email': 'locked@example.com', 'password': 'wrongpassword'}
+        with patch('users.views.login_lockout', self.lockout):
+            for _ in range(3):
+                response = self.client.post(reverse('login'), data, format='json')
+                self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            with patch('users.views.authenticate') as authenticate:
+                response = self.client.post(
+                    reverse('login'), data | {'password': 'securepassword123'}, format='json'
+                )
+        authenticate.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(response.data['detail'], 'Demasiados intentos fallidos. Intenta de nuevo en 60 segundos.')
+
+    async def test_async_locked_login(self):
+        data = {'email': 'locked@example.com', 'password': 'wrongpassword'}
+        with patch('users.async_views.login_lockout', self.lockout), override_settings(ROOT_URLCONF='users.async_urls'):
+            for _ in range(3):
+                response = await self.async_client.post('/login/', data, content_type='application/json')
+                self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            response = await self.async_client.post('/login/', data, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '60')
+
+
+class PathScopedMiddlewareTests(APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email='admin@example.com', password='securepassword123')
+
+    def test_api_skips_stateful_middleware(self):
+        response = self.client.post(reverse('login'), {'email': 'admin@example.com'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn('X-Frame-Options', response)
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        self.assertFalse(response.cookies)
+
+    def test_admin_login(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        response = client.get('/admin/')
+        self.assertRedirects(response, '/admin/login/?next=/admin/')
+
+        response = client.get('/admin/login/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Frame-Options'], 'DENY')
+        credentials = {'username': 'admin@example.com', 'password': 'securepassword123'}
+        response = client.post('/admin/login/', credentials)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        token = client.cookies['csrftoken'].value
+        response = client.post('/admin/login/', credentials | {'csrfmiddlewaretoken': token, 'next': '/admin/'})
+        self.assertRedirects(response, '/admin/')
+        response = client.get('/admin/users/user/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, 'admin@example.com')
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], REPLICA_CHECK_INTERVAL=60)
+class ReplicaRouterTests(APITransactionTestCase):
+    databases = {'default', 'replica_1'}
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        replicas.clear()
+        self.user = User.objects.create_user(email='test@example.com', password='testpass123')
+        self.user.otp_secret = pyotp.random_base32()
+        self.user.save()
+        request_started.send(sender=None)
+
+    def user_queries(self, fn):
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections['replica_1']) as replica:
+                fn()
+        count = lambda ctx: sum('FROM "users_user"' in q['sql'] for q in ctx.captured_queries)
+        return count(primary), count(replica)
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.user_queries(lambda: User.objects.get(pk=self.user.pk)), (0, 1))
+        self.assertEqual(router.db_for_read(Group), 'default')
+
+    def test_write_pins_request_to_primary(self):
+        self.user.transition({'otp_verified': False}, otp_verified=True)
+        self.assertEqual(self.user_queries(lambda: User.objects.get(pk=self.user.pk)), (1, 0))
+        request_started.send(sender=None)
+        self.assertEqual(router.db_for_read(User), 'replica_1')
+
+    def test_mfa_state_change_read_back_from_primary(self):
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        code = pyotp.TOTP(self.user.otp_secret).now()
+        response = self.client.post(reverse('mfa-validate'), {'code': code})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Next request, possibly in another worker: the user is reloaded from the primary.
+        user_cache.clear()
+        get_setup = lambda: self.client.get(reverse('mfa-setup'))
+        self.assertEqual(self.user_queries(get_setup), (1, 0))
+
+        cache.delete(replicas.pin_key(f'user:{self.user.pk}'))
+        user_cache.clear()
+        self.assertEqual(self.user_queries(get_setup), (0, 1))
+
+    def test_login_after_mfa_change_reads_primary(self):
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        code = pyotp.TOTP(self.user.otp_secret).now()
+        self.assertEqual(self.client.post(reverse('mfa-validate'), {'code': code}).status_code, status.HTTP_200_OK)
+        self.client.credentials()
+        get = QuerySet.get
+
+        def lagging_get(queryset, *args, **kwargs):
+            user = get(queryset, *args, **kwargs)
+            if queryset.db == 'replica_1':
+                user.otp_verified = False
+            return user
+
+        login = lambda: self.client.post(reverse('login'), {
+            'email': 'test@example.com', 'password': 'testpass123',
+        }, format='json')
+        with patch.object(QuerySet, 'get', lagging_get):
+            request_started.send(sender=None)
+            self.assertTrue(login().data['otp_verified'])
+            cache.delete(replicas.pin_key('user-email:test@example.com'))
+            self.assertFalse(login().data['otp_verified'])
+
+    def test_user_missing_on_replica_read_from_primary(self):
+        get = QuerySet.get
+
+        def lagging_get(queryset, *args, **kwargs):
+            if queryset.db == 'replica_1':
+                raise queryset.model.DoesNotExist
+            return get(queryset, *args, **kwargs)
+
+        with patch.object(QuerySet, 'get', lagging_get):
+            response = self.client.post(reverse('login'), {
+                'email': 'test@example.com', 'password': 'testpass123',
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(user_cache.get(self.user.pk).email, 'test@example.com')
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        with patch.object(Replicas, 'lag', return_value=10.0), self.assertLogs('utils.db_router', 'WARNING'):
+            self.assertEqual(router.db_for_read(User), 'default')
+
+        replicas.clear()
+        with patch.object(Replicas, 'lag', return_value=None), self.assertLogs('utils.db_router', 'WARNING'):
+            self.assertEqual(router.db_for_read(User), 'default')
+
+        with override_settings(REPLICA_CHECK_INTERVAL=0), patch.object(Replicas, 'lag', return_value=0.5):
+            self.assertEqual(router.db_for_read(User), 'replica_1')
+
+    def test_unreachable_replica(self):
+        with patch.object(connections['replica_1'], 'cursor', side_effect=OperationalError):
+            with self.assertLogs('utils.db_router', 'ERROR'):
+                self.assertIsNone(replicas.lag('replica_1'))
+        self.assertEqual(replicas.lag('replica_1'), 0)
+
+
+class FastJSONTests(APITestCase):
+
+    payloads = [
+        {'token': 'abc', 'otp_activated': True, 'otp_verified': False},
+        {'code': [serializers.ErrorDetail('Código OTP inválido', code='invalid')]},
+        {'detail': _('Not found.'), 'amount': Decimal('1.50'), 'items': [1, None, 2.5]},
+        {'date': datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc), 'id': uuid.UUID(int=1)},
+        {'text': 'línea\u2028otra\u2029fin'},
+        {'users': {1: {'email': [serializers.ErrorDetail('Correo inválido', code='invalid')]}}},
+        {'id': 2 ** 64, 'negative': -2 ** 70},
+    ]
+
+    def test_same_output_as_drf(self):
+        for fast_json in (True, False):
+            with patch('utils.fast_json.orjson', orjson if fast_json else None):
+                renderer = FastJSONRenderer()
+            for payload in self.payloads:
+                with self.subTest(orjson=fast_json, payload=payload):
+                    self.assertEqual(renderer.render(payload), JSONRenderer().render(payload))
+
+    def test_non_finite_floats_raise_like_drf(self):
+        for fast_json in (True, False):
+            with patch('utils.fast_json.orjson', orjson if fast_json else None):
+                renderer = FastJSONRenderer()
+            for payload in ({'amount': float('nan')}, {'items': [None, float('inf')]}, {'a': Decimal('NaN')}):
+                with self.subTest(orjson=fast_json, payload=payload):
+                    with self.assertRaisesMessage(ValueError, 'Out of range float values are not JSON compliant'):
+                        JSONRenderer().render(payload)
+                    with self.assertRaisesMessage(ValueError, 'Out of range float values are not JSON compliant'):
+                        renderer.render(payload)
+
+    def test_indent_uses_drf(self):
+        rendered = FastJSONRenderer().render({'a': 1}, 'application/json; indent=2')
+        self.assertEqual(rendered, b'{\n  "a": 1\n}')
+
+    def test_parse(self):
+        for fast_json in (True, False):
+            with patch('utils.fast_json.orjson', orjson if fast_json else None):
+                parser = FastJSONParser()
+                self.assertEqual(parser.parse(BytesIO('{"email": "ñ@example.com"}'.encode())), {'email': 'ñ@example.com'})
+                with self.assertRaises(ParseError):
+                    parser.parse(BytesIO(b'{"email": '))
+                with self.assertRaises(ParseError):
+                    parser.parse(BytesIO(b'{"amount": NaN}'))
+
+    def test_malformed_body(self):
+        response = self.client.post(reverse('login'), '{"email": ', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('JSON parse error', response.json()['detail'])
+
+
+class SlidingWindowThrottleTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().post('/api/login/', REMOTE_ADDR='10.0.0.1')
+        self.request.user = None
+        self.view = type('View', (), {'throttle_scope': 'login'})()
+
+    def allow(self, now):
+        throttle = LoginThrottle()
+        throttle.timer = lambda: now
+        return throttle.allow_request(self.request, self.view), throttle
+
+    def test_limit_within_window(self):
+        self.assertTrue(self.allow(600)[0])
+        self.assertTrue(self.allow(610)[0])
+        allowed, throttle = self.allow(620)
+        self.assertFalse(allowed)
+        self.assertEqual(throttle.wait(), 40)
+
+    def test_previous_window_is_weighted(self):
+        self.allow(630)
+        self.allow(640)
+        self.assertTrue(self.allow(665)[0])
+        self.assertFalse(self.allow(670)[0])
+        self.assertTrue(self.allow(725)[0])
+
+    def test_counters_are_per_client(self):
+        self.allow(600)
+        self.allow(600)
+        self.request.META['REMOTE_ADDR'] = '10.0.0.2'
+        self.assertTrue(self.allow(600)[0])
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(APITestCase):
+
+    def test_connections_are_reused(self):
+        pool = ConnectionPool(FakeConnection, min_size=1, max_size=2)
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(pool.metrics()['created'], 1)
+
+    def test_acquire_times_out_when_exhausted(self):
+        pool = ConnectionPool(FakeConnection, min_size=0, max_size=1, timeout=0.01)
+        pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual(pool.metrics()['timeouts'], 1)
+
+    def test_unusable_connections_are_replaced(self):
+        pool = ConnectionPool(
+            FakeConnection, min_size=1, max_size=1, check=lambda c: False, check_after=0
+        )
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIsNot(pool.acquire(), connection)
+        metrics = pool.metrics()
+        self.assertEqual((metrics['discarded'], metrics['size'], metrics['in_use']), (2, 1, 1))
+
+    def test_check_runs_without_the_lock(self):
+        checking, done = threading.Event(), threading.Event()
+
+        def slow_check(connection):
+            checking.set()
+            return done.wait(5)
+
+        pool = ConnectionPool(FakeConnection, min_size=1, max_size=2, check=slow_check, check_after=0)
+        thread = threading.Thread(target=pool.acquire)
+        thread.start()
+        self.assertTrue(checking.wait(5))
+        start = time.monotonic()
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertEqual(pool.metrics()['idle'], 1)
+        self.assertLess(time.monotonic() - start, 1)
+        done.set()
+        thread.join()
+
+    def test_closed_connections_are_not_returned(self):
+        pool = ConnectionPool(FakeConnection, min_size=0, max_size=1)
+        connection = pool.acquire()
+        connection.close()
+        pool.release(connection)
+        self.assertEqual(pool.metrics()['size'], 0)
+
+
+class MetricsTests(APITestCase):
+
+    def setUp(self):
+        self.registry = Registry(tempfile.mkdtemp())
+        patcher = patch('utils.metrics.registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        User.objects.create_user(email="testuser@example.com", password="securepassword123")
+
+    def test_login_records_latency_and_phases(self):
+        data = {"email": "testuser@example.com", "password": "securepassword123"}
+        self.client.post(reverse('login'), data, format='json')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = response.content.decode()
+        self.assertIn('http_request_duration_seconds_count{method="POST",status="2xx",view="login"} 1', content)
+        self.assertIn('http_request_phase_seconds_count{phase="hashing",view="login"} 1', content)
+        self.assertIn('http_request_phase_seconds_count{phase="db",view="login"} 1', content)
+        self.assertRegex(content, r'db_queries_total\{view="login"\} [1-9]')
+
+    def test_workers_are_aggregated(self):
+        other = Registry(self.registry.directory)
+        other.observe('http_request_duration_seconds', 0.2, view='login')
+        with open(os.path.join(self.registry.directory, '1.json'), 'w') as f:
+            json.dump(other.snapshot(), f)
+        self.registry.observe('http_request_duration_seconds', 0.02, view='login')
+
+        content = render(*self.registry.collect())
+        self.assertIn('http_request_duration_seconds_count{view="login"} 2', content)
+        self.assertIn('http_request_duration_seconds_bucket{view="login",le="0.025"} 1', content)
+        self.assertIn('http_request_duration_seconds_bucket{view="login",le="0.25"} 2', content)
+
+    def test_retired_worker_keeps_totals_and_drops_gauges(self):
+        for pid in (1, 2):
+            other = Registry(self.registry.directory)
+            other.inc('http_requests_total', view='login')
+            other.observe('http_request_duration_seconds', 0.2, view='login')
+            snapshot = other.snapshot() | {'gauges': [['db_pool_in_use', [['alias', 'default']], 3]]}
+            with open(os.path.join(self.registry.directory, f'{pid}.json'), 'w') as f:
+                json.dump(snapshot, f)
+        self.assertIn('db_pool_in_use{alias="default",pid="1"} 3', render(*self.registry.collect()))
+
+        self.registry.retire(1)
+        self.registry.retire(2)
+        self.registry.retire(3)
+        content = render(*self.registry.collect())
+        self.assertIn('http_requests_total{view="login"} 2', content)
+        self.assertIn('http_request_duration_seconds_count{view="login"} 2', content)
+        self.assertNotIn('db_pool_in_use', content)
+        self.assertEqual(
+            sorted(os.listdir(self.registry.directory)), sorted([f'{os.getpid()}.json', 'retired.json'])
+        )
+
+
+class ImportUsersCommandTests(APITestCase):
+
+    def write(self, suffix, content):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_csv(self):
+        path = self.write('.csv', 'email,password\nuno@example.com,pass12345\n,sinemail\nDos@Example.COM,\n')
+        out = StringIO()
+        call_command('import_users', path, workers=0, batch_size=1, stdout=out, stderr=StringIO())
+        self.assertIn('2 usuarios importados, 1 filas omitidas, 0 emails existentes', out.getvalue())
+
+        user = User.objects.get(email='uno@example.com')
+        self.assertTrue(user.check_password('pass12345'))
+        self.assertEqual(len(user.otp_secret), 32)
+        self.assertFalse(User.objects.get(email='Dos@example.com').has_usable_password())
+
+    def test_import_jsonl_with_pool_and_conflicts(self):
+        User.objects.create_user(email='uno@example.com', password='pass12345')
+        path = self.write('.jsonl', '\n'.join(
+            json.dumps({'email': f'{name}@example.com', 'password': 'pass12345'})
+            for name in ('uno', 'dos', 'tres')
+        ))
+        with self.assertRaises(CommandError):
+            call_command('import_users', path, workers=0, stdout=StringIO())
+
+        out = StringIO()
+        call_command('import_users', path, workers=1, ignore_conflicts=True, stdout=out)
+        self.assertIn('2 usuarios importados, 0 filas omitidas, 1 emails existentes', out.getvalue())
+        self.assertEqual(User.objects.count(), 3)
+        self.assertTrue(User.objects.get(email='tres@example.com').check_password('pass12345'))
+
+
+class UserListViewTests(APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(email='admin@example.com', password='securepassword123', is_staff=True)
+        User.objects.bulk_create(
+            User(email=f'user{i}@example.com', otp_activated=i % 2 == 0) for i in range(5)
+        )
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('user-list')
+
+    def test_cursor_pages(self):
+        response = self.client.get(self.url, {'page_size': 4})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertNotIn('count', response.data)
+
+        next_page = self.client.get(response.data['next'])
+        ids = [user['id'] for user in response.data['results'] + next_page.data['results']]
+        self.assertEqual(ids, sorted(User.objects.values_list('id', flat=True), reverse=True))
+        self.assertIsNone(next_page.data['next'])
+
+    def test_filters(self):
+        response = self.client.get(self.url, {'otp_activated': 'false'})
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(self.url, {'is_staff': 'true'})
+        self.assertEqual([user['email'] for user in response.data['results']], ['admin@example.com'])
+
+    def test_only_admins(self):
+        self.client.force_authenticate(User.objects.get(email='user0@example.com'))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_export_users(self):
+        fd, path = tempfile.mkstemp(suffix='.jsonl.gz')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        call_command('export_users', path, otp_activated=False, stderr=StringIO())
+        with gzip.open(path, 'rt') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row['email'] for row in rows], ['user1@example.com', 'user3@example.com'])
+
+        call_command('export_users', path, format='csv', stderr=StringIO())
+        with gzip.open(path, 'rt') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 6)
+        self.assertNotIn('password', rows[0])
+
+
+class EncryptionTests(APITestCase):
+
+    def setUp(self):
+        self.old_key = Fernet.generate_key().decode()
+        self.new_key = Fernet.generate_key().decode()
+        patcher = patch('utils.encryption._keyring', Keyring({'1': self.old_key}, '1'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.secret = pyotp.random_base32()
+        self.user = User.objects.create_user(
+            email='crypto@example.com', password='securepassword123', otp_secret=self.secret
+        )
+
+    def raw_secret(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT otp_secret FROM users_user WHERE id = %s', [self.user.pk])
+            return cursor.fetchone()[0]
+
+    def test_otp_secret_is_encrypted(self):
+        self.assertTrue(self.raw_secret().startswith('1$'))
+        self.assertNotIn(self.secret, self.raw_secret())
+        self.assertEqual(User.objects.get(pk=self.user.pk).otp_secret, self.secret)
+
+    def test_rotate_encryption_key(self):
+        User.objects.create_user(email='nosecret@example.com', password='securepassword123')
+        keyring = Keyring({'1': self.old_key, '2': self.new_key}, '2')
+        self.assertEqual(keyring.decrypt(self.raw_secret()), self.secret)
+
+        fd, checkpoint = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, checkpoint)
+        with patch('utils.encryption._keyring', keyring):
+            call_command('rotate_encryption_key', sleep=0, checkpoint=checkpoint, stdout=StringIO())
+            self.assertTrue(self.raw_secret().startswith('2$'))
+            self.assertEqual(User.objects.get(pk=self.user.pk).otp_secret, self.secret)
+
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f), {'primary_id': '2', 'last_id': self.user.pk})
+        with self.assertRaises(InvalidToken):
+            Keyring({'1': self.old_key}, '1').decrypt(self.raw_secret())
+
 
 class MFASetupViewTests(APITestCase):
 
@@ -115,6 +1065,21 @@ class MFASetupViewTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('otp_uri', response.data)
 
+    def test_mfa_setup_uses_cached_user(self):
+        cache.clear()
+        self.user.provision_otp_secret()
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_mfa_setup_sees_user_changes(self):
+        self.client.get(self.url)
+        self.user.transition({'otp_verified': False}, otp_verified=True)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_mfa_setup_already_verified(self):
         self.user.otp_verified = True
         self.user.save()
@@ -122,10 +1087,51 @@ class MFASetupViewTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('Error en la petición', response.data['detail'])
 
+    def test_mfa_setup_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_mfa_setup_etag_changes_with_secret(self):
+        self.user.transition({'otp_activated': True}, otp_activated=False)
+        self.user.activate_otp()
+        first = self.client.get(self.url)
+        self.user.transition({'otp_activated': True}, otp_activated=False)
+        self.user.activate_otp()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertIn(self.user.otp_secret, response.data['otp_uri'])
+
+    def test_mfa_setup_qr(self):
+        provisioning_cache.clear()
+        response = self.client.get(self.url, {'qr': 'svg'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertTrue(response.content.startswith(b'<?xml'))
+        png = self.client.get(self.url, {'qr': 'png'}).content
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        with patch.object(provisioning_cache, 'render') as render:
+            response = self.client.get(self.url, {'qr': 'png'})
+        render.assert_not_called()
+        self.assertEqual(response.content, png)
+        self.assertEqual(self.client.get(self.url, {'qr': 'gif'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_mfa_setup_not_modified_skips_render(self):
+        response = self.client.get(self.url, {'qr': 'png'})
+        provisioning_cache.clear()
+        with patch.object(provisioning_cache, 'render') as render:
+            response = self.client.get(self.url, {'qr': 'png'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        render.assert_not_called()
+
 
 class MFAValidateViewTests(APITestCase):
 
     def setUp(self):
+        cache.clear()
         self.user = User.objects.create_user(email='test@example.com', password='testpass123')
         self.user.otp_secret = pyotp.random_base32()
         self.user.save()
@@ -146,6 +1152,20 @@ class MFAValidateViewTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIsNone(response.data)
 
+    def test_mfa_validation_single_conditional_update(self):
+        totp = pyotp.TOTP(self.user.otp_secret)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(self.url, {'code': totp.now()})
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "users_user"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('SET "otp_verified"', updates[0])
+        self.assertNotIn('"password"', updates[0])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(self.url, {'code': totp.now()})
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(inserts, [])
+
     def test_mfa_validation_invalid_code(self):
         response = self.client.post(self.url, {'code': '123456'})
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -156,6 +1176,66 @@ class MFAValidateViewTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('code', response.data)
 
+    def test_mfa_validation_code_is_single_use(self):
+        code = pyotp.TOTP(self.user.otp_secret).now()
+        response = self.client.post(self.url, {'code': code})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(self.url, {'code': code})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Código OTP inválido', response.data['code'])
+
+    def test_verifier_window_matches_pyotp(self):
+        verifier = TOTPVerifier(valid_window=1)
+        totp = pyotp.TOTP(self.user.otp_secret)
+        now = 1700000000
+        for offset, expected in ((-60, None), (-30, 0), (0, 0), (30, 0), (60, None)):
+            step = verifier.match(self.user.pk, self.user.otp_secret, totp.at(now + offset), now)
+            if expected is None:
+                self.assertIsNone(step)
+            else:
+                self.assertEqual(step, (now + offset) // 30)
+
+        secret = pyotp.random_base32()
+        self.assertIsNotNone(verifier.match(self.user.pk, secret, pyotp.TOTP(secret).at(now), now))
+        self.assertTrue(verifier.verify(self.user.pk, secret, pyotp.TOTP(secret).at(now), now))
+        self.assertFalse(verifier.verify(self.user.pk, secret, pyotp.TOTP(secret).at(now), now))
+
+    def test_default_window_accepts_current_step_only(self):
+        self.assertEqual(settings.TOTP_VALID_WINDOW, 0)
+        verifier = TOTPVerifier(valid_window=settings.TOTP_VALID_WINDOW)
+        totp = pyotp.TOTP(self.user.otp_secret)
+        now = 1700000010
+        self.assertEqual(verifier.match(self.user.pk, self.user.otp_secret, totp.at(now), now), now // 30)
+        for offset in (-30, 30):
+            self.assertIsNone(verifier.match(self.user.pk, self.user.otp_secret, totp.at(now + offset), now))
+
+    def test_mfa_validation_malformed_code(self):
+        response = self.client.post(self.url, {'code': '12345a'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['code'], ['Código incompatible'])
+
+    def test_fast_serializer_matches_drf_errors(self):
+        class Serializer(serializers.Serializer):
+            code = CustomCharField(validate_regex={
+                'regex': r'^\d{6}$', 'error_message': 'Código incompatible'
+            })
+
+        for data in ({}, {'code': ''}, {'code': 'abc'}, {'code': '123456'}, {'code': 12345}, {'code': 123456}, []):
+            fast = MFAValidateSerializer(data=data)
+            drf = Serializer(data=data)
+            self.assertEqual(fast.is_valid(), drf.is_valid())
+            self.assertEqual(fast.errors, drf.errors)
+            if not fast.errors:
+                self.assertEqual(fast.validated_data, drf.validated_data)
+
+    def test_regex_applies_to_numbers(self):
+        serializer = MFAValidateSerializer(data={'code': 12345})
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors, {'code': ['Código incompatible']})
+        serializer = MFAValidateSerializer(data={'code': 123456})
+        self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.validated_data, {'code': '123456'})
+
 
 class MFADisableViewTests(APITestCase):
 
@@ -178,10 +1258,16 @@ class MFADisableViewTests(APITestCase):
         response = self.client.post(self.url, {'code': self.code})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_recovery_code_is_consumed_once(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(self.user.verify_recovery_code(self.code))
+        self.assertFalse(self.user.verify_recovery_code(self.code))
+        self.assertEqual(self.user.recovery_codes.count(), 9)
+
     def test_mfa_disable_not_activated(self):
         self.user.otp_activated = False
         self.user.save()
-        response = self.client.post(self.url, {'code': 'recovery_code'})
+        response = self.client.post(self.url, {'code': 'recovery12'})
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('Error en la petición', response.data['detail'])
 
@@ -191,6 +1277,41 @@ class MFADisableViewTests(APITestCase):
         self.assertIn('code', response.data)
 
 
+class RecoveryCodesViewTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='test@example.com', password='testpass123', otp_activated=True,
+            otp_verified=True, otp_secret=pyotp.random_base32()
+        )
+        self.old_code = self.user.generate_recovery_codes()[0]
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer { token }')
+        self.url = reverse('mfa-recovery-codes')
+
+    def test_regenerate_after_secret_key_rotation(self):
+        with override_settings(SECRET_KEY='rotated-secret-key'):
+            self.assertFalse(self.user.verify_recovery_code(self.old_code))
+            response = self.client.post(self.url, {'code': pyotp.TOTP(self.user.otp_secret).now()})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            codes = response.data['recovery_codes']
+            self.assertEqual(len(codes), 10)
+            self.assertEqual(self.user.recovery_codes.count(), 10)
+            self.assertTrue(self.user.verify_recovery_code(codes[0]))
+
+    def test_invalid_code(self):
+        response = self.client.post(self.url, {'code': '000000'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(self.user.verify_recovery_code(self.old_code))
+
+    def test_not_verified(self):
+        self.user.otp_verified = False
+        self.user.save()
+        response = self.client.post(self.url, {'code': pyotp.TOTP(self.user.otp_secret).now()})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 class MFAActivateViewTests(APITestCase):
 
     def setUp(self):
@@ -205,6 +1326,10 @@ class MFAActivateViewTests(APITestCase):
         response = self.client.post(self.url, {'password': 'testpass123'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_mfa_activation_only_once(self):
+        self.assertTrue(self.user.activate_otp())
+        self.assertFalse(self.user.activate_otp())
+
     def test_mfa_activation_already_activated(self):
         self.user.otp_activated = True
         self.user.save()
@@ -217,3 +1342,109 @@ class MFAActivateViewTests(APITestCase):
         response = self.client.post(self.url)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('password', response.data)
+
+
+@override_settings(ROOT_URLCONF='users.async_urls')
+class AsyncViewsTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='async@example.com',
+            password='securepassword123',
+            otp_secret=pyotp.random_base32()
+        )
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.auth_header = {'Authorization': f'Bearer { token }'}
+
+    async def test_csrf_exempt(self):
+        client = AsyncClient(enforce_csrf_checks=True)
+        data = {'email': 'async@example.com', 'password': 'securepassword123'}
+        response = await client.post(reverse('login'), data, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        data = {'email': 'csrf@example.com', 'password': 'securepassword123'}
+        response = await client.post(reverse('signup'), data, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Without a valid body but past the CSRF check, a 403 would mean it wasn't.
+        for name in ['mfa-validate', 'mfa-disable', 'mfa-activate']:
+            response = await client.post(
+                reverse(name), {}, content_type='application/json', headers=self.auth_header
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, name)
+
+    async def test_login_successful(self):
+        data = {'email': 'async@example.com', 'password': 'securepassword123'}
+        response = await self.async_client.post(
+            reverse('login'), data, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('token', response.json())
+
+    async def test_login_invalid_credentials(self):
+        data = {'email': 'async@example.com', 'password': 'wrongpassword'}
+        response = await self.async_client.post(
+            reverse('login'), data, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json()['detail'], 'Credenciales inválidas')
+
+    async def test_login_missing_fields(self):
+        data = {'email': 'async@example.com'}
+        response = await self.async_client.post(
+            reverse('login'), data, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('password', response.json())
+
+    async def test_signup_success(self):
+        data = {'email': 'newasync@example.com', 'password': 'password123'}
+        response = await self.async_client.post(
+            reverse('signup'), data, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(await User.objects.filter(email='newasync@example.com').aexists())
+
+    async def test_mfa_setup_requires_authentication(self):
+        response = await self.async_client.get(reverse('mfa-setup'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_mfa_setup_not_modified(self):
+        response = await self.async_client.get(reverse('mfa-setup'), headers=self.auth_header)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = await self.async_client.get(
+            reverse('mfa-setup'), {'qr': 'svg'}, headers=self.auth_header | {'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = await self.async_client.get(
+            reverse('mfa-setup'), {'qr': 'svg'}, headers=self.auth_header | {'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_mfa_setup_provisions_secret(self):
+        await User.objects.filter(pk=self.user.pk).aupdate(otp_secret=None)
+        response = await self.async_client.get(reverse('mfa-setup'), headers=self.auth_header)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        await self.user.arefresh_from_db()
+        self.assertIn(self.user.otp_secret, response.json()['otp_uri'])
+
+    async def test_mfa_validate_success(self):
+        code = pyotp.TOTP(self.user.otp_secret).now()
+        response = await self.async_client.post(
+            reverse('mfa-validate'), {'code': code},
+            content_type='application/json', headers=self.auth_header
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('recovery_codes', response.json())
+        await self.user.arefresh_from_db()
+        self.assertTrue(self.user.otp_verified)
+
+    async def test_mfa_activate_success(self):
+        self.user.otp_activated = False
+        await self.user.asave()
+        response = await self.async_client.post(
+            reverse('mfa-activate'), {'password': 'securepassword123'},
+            content_type='application/json', headers=self.auth_header
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -0,0 +1,84 @@
+import base64
+import hmac
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class TOTPVerifier:
+    """
+    RFC 6238 verification without building a pyotp.TOTP per request. Each
+    worker keeps an LRU of keyed HMAC objects per user, so a verification is
+    one copy + update per time step of the drift window. Accepted codes are
+    recorded in the shared cache as "totp-used:<user>:<step>" until the step
+    leaves the window, a second use of the same step is rejected.
+    """
+
+    def __init__(self, interval=30, digits=6, valid_window=0, max_size=10000):
+        self.interval = interval
+        self.digits = digits
+        self.valid_window = valid_window
+        self.max_size = max_size
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def used_key(user_id, step):
+        return f'totp-used:{user_id}:{step}'
+
+    def _get_hmac(self, user_id, secret):
+        with self._lock:
+            entry = self._keys.get(user_id)
+            if entry is not None and entry[0] == secret:
+                self._keys.move_to_end(user_id)
+                return entry[1]
+
+        padding = '=' * (-len(secret) % 8)
+        key = base64.b32decode(secret.upper() + padding, casefold=True)
+        keyed = hmac.new(key, digestmod='sha1')
+        with self._lock:
+            self._keys[user_id] = (secret, keyed)
+            self._keys.move_to_end(user_id)
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+        return keyed
+
+    def _code(self, keyed, step):
+        mac = keyed.copy()
+        mac.update(struct.pack('>Q', step))
+        digest = mac.digest()
+        offset = digest[-1] & 0x0F
+        value = struct.unpack('>I', digest[offset:offset + 4])[0] & 0x7FFFFFFF
+        return str(value % 10 ** self.digits).zfill(self.digits)
+
+    def match(self, user_id, secret, code, for_time=None):
+        """Returns the time step the code belongs to or None."""
+        if not secret or not code or len(code) != self.digits or not code.isdigit():
+            return None
+
+        keyed = self._get_hmac(user_id, secret)
+        now = time.time() if for_time is None else for_time
+        current = int(now // self.interval)
+        matched = None
+        for step in range(current - self.valid_window, current + self.valid_window + 1):
+            if hmac.compare_digest(self._code(keyed, step), code):
+                matched = step
+        return matched
+
+    def verify(self, user_id, secret, code, for_time=None):
+        step = self.match(user_id, secret, code, for_time)
+        if step is None:
+            return False
+        timeout = self.interval * (2 * self.valid_window + 1)
+        return cache.add(self.used_key(user_id, step), True, timeout)
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
+totp_verifier = TOTPVerifier(valid_window=settings.TOTP_VALID_WINDOW)
@@ -1,29 +1,43 @@
-import pyotp
-from django.conf import settings
+from django.http import HttpResponse
 from rest_framework import status
 from rest_framework.response import Response
 from .serializers import *
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.generics import ListAPIView
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.views import APIView
+from .lockout import LockedOut, client_ip, login_lockout
 from .models import User
-from utils.common_functions import send_email
+from .pagination import UserCursorPagination
+from .provisioning import etag, not_modified, provisioning_cache
+from .totp import totp_verifier
+from utils import hashing
+from utils.metrics import timed
 
 
 class LoginView(APIView):
 
+    throttle_scope = 'login'
+
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         email = serializer.validated_data.get("email")
         password = serializer.validated_data.get("password")
+        ip = client_ip(request)
+        wait = login_lockout.locked(email, ip)
+        if wait:
+            raise LockedOut(wait)
+
         user = authenticate(email=email, password=password)
         if not user:
+            login_lockout.failed(email, ip)
             error = {'detail': 'Credenciales inválidas'}
             return Response(error, status=status.HTTP_401_UNAUTHORIZED)
 
         if user:
+            login_lockout.succeeded(email)
             refresh = RefreshToken.for_user(user)
             resp = {
                 'token': str(refresh.access_token),
@@ -35,25 +49,36 @@ class LoginView(APIView):
 
 class SignInView(APIView):
 
+    throttle_scope = 'signup'
+
     def post(self, request):
         serializer = UserSerializer(data=request.data)
+        # The email's unique validator is an index lookup, taken emails are
+        # rejected before the password is hashed.
         serializer.is_valid(raise_exception=True)
-        user_data = serializer.validated_data
-        password = serializer.validated_data.pop('password')
-        user_data |= {'otp_secret': pyotp.random_base32()}
+        email = serializer.validated_data['email']
+        password = hashing.make_password(serializer.validated_data['password'])
 
-        try:
-            user = User(**user_data)
-            user.set_password(password)
-            user.save()
-        except Exception:
-            error = {'detail': 'Ha ocurrido un error inesperado'}
-            return Response(error, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if User.objects.signup(email, password) is None:
+            error = {'email': [EMAIL_TAKEN]}
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
 
-        send_email()
         return Response(status=status.HTTP_201_CREATED)
 
 
+class BulkSignupView(APIView):
+
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = BulkSignupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        users = [(user['email'], user['password']) for user in serializer.validated_data['users']]
+        created, taken = User.objects.bulk_signup(users)
+        resp = {'created': created, 'taken': taken}
+        return Response(resp, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
 class MFASetupView(APIView):
 
     permission_classes = [IsAuthenticated]
@@ -65,35 +90,50 @@ class MFASetupView(APIView):
             error = {"detail": ["Error en la petición"]}
             return Response(error, status=status.HTTP_400_BAD_REQUEST)
 
-        otp_uri = pyotp.totp.TOTP(user.otp_secret).provisioning_uri(
-            name=user.email, issuer_name=settings.ISSUER_NAME
-        )
+        image_format = request.query_params.get('qr')
+        if image_format is not None and image_format not in provisioning_cache.content_types:
+            error = {"qr": ["Formato inválido, usa svg o png"]}
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+        if user.otp_secret is None:
+            user.provision_otp_secret()
+        # The URI carries the secret, only the client may keep a copy.
+        fingerprint = provisioning_cache.user_fingerprint(user)
+        headers = {'ETag': etag(fingerprint, image_format), 'Cache-Control': 'private, no-cache'}
+        if not_modified(request, headers['ETag']):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        if image_format:
+            _, image = provisioning_cache.qr(user, image_format)
+            content_type = provisioning_cache.content_types[image_format]
+            return HttpResponse(image, content_type=content_type, headers=headers)
+        _, otp_uri = provisioning_cache.uri(user)
         data = {"otp_uri": otp_uri}
-        return Response(data, status=status.HTTP_200_OK)
+        return Response(data, status=status.HTTP_200_OK, headers=headers)
 
 
 class MFAValidateView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'mfa-validate'
 
     def post(self, request):
         serializer = MFAValidateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         code = serializer.validated_data.get('code')
         user = request.user
-        totp = pyotp.TOTP(user.otp_secret)
-        if not totp.verify(code):
+        with timed('totp'):
+            valid = totp_verifier.verify(user.pk, user.otp_secret, code)
+        if not valid:
             error = {"code": ["Código OTP inválido"]}
             return Response(error, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            user.otp_verified = True
-            user.save()
+            recovery_codes = user.mark_otp_verified()
         except Exception:
             error = {'detail': 'Ha ocurrido un error inesperado'}
             return Response(error, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        if not user.recovery_codes:
-            recovery_codes = user.generate_recovery_codes()
+        if recovery_codes:
             resp = {"recovery_codes": recovery_codes}
             return Response(resp, status=status.HTTP_200_OK)
 
@@ -112,19 +152,16 @@ class MFADisableView(APIView):
             error = {"detail": ["Error en la petición"]}
             return Response(error, status=status.HTTP_400_BAD_REQUEST)
 
-        if not user.verify_recovery_code(code):
-            error = {'code': 'Código inválido'}
-            return Response(error, status=status.HTTP_400_BAD_REQUEST)
-
         try:
-            user.otp_secret = None
-            user.otp_activated = False
-            user.otp_verified = False
-            user.save()
+            disabled = user.disable_otp(code)
         except Exception:
             error = {'detail': 'Ha ocurrido un error inesperado'}
             return Response(error, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        if not disabled:
+            error = {'code': 'Código inválido'}
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
         return Response(status=status.HTTP_200_OK)
 
 
@@ -147,11 +184,53 @@ class MFAActivateView(APIView):
             return Response(error, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            user.otp_secret = pyotp.random_base32()
-            user.otp_activated = True
-            user.save()
+            activated = user.activate_otp()
         except Exception:
             error = {'detail': 'Ha ocurrido un error inesperado'}
             return Response(error, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        if not activated:
+            error = {"detail": ["Error en la petición"]}
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
         return Response(status=status.HTTP_200_OK)
+
+
+class RecoveryCodesView(APIView):
+
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'mfa-validate'
+
+    def post(self, request):
+        serializer = MFAValidateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        code = serializer.validated_data.get('code')
+        user = request.user
+        if not user.otp_verified:
+            error = {"detail": ["Error en la petición"]}
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+        with timed('totp'):
+            valid = totp_verifier.verify(user.pk, user.otp_secret, code)
+        if not valid:
+            error = {"code": ["Código OTP inválido"]}
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+        resp = {"recovery_codes": user.generate_recovery_codes()}
+        return Response(resp, status=status.HTTP_200_OK)
+
+
+class UserListView(ListAPIView):
+
+    permission_classes = [IsAdminUser]
+    serializer_class = UserListSerializer
+    pagination_class = UserCursorPagination
+    filter_fields = ['is_active', 'otp_activated', 'is_staff', 'is_superuser']
+
+    def get_queryset(self):
+        queryset = User.objects.only(*UserListSerializer.Meta.fields)
+        for field in self.filter_fields:
+            value = self.request.query_params.get(field)
+            if value is not None:
+                queryset = queryset.filter(**{field: value.lower() in ('1', 'true')})
+        return queryset
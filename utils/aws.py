@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(service_name, region_name='us-east-1'):
+    # boto3 clients are thread safe but must not cross a fork, hence the pid.
+    key = (service_name, region_name, os.getpid())
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                # boto3 takes ~150ms to import, only pay it when AWS is used.
+                import boto3
+
+                client = boto3.client(service_name, region_name=region_name)
+                _clients[key] = client
+    return client
+
+
+class SecretsCache:
+    """
+    Process level cache for a Secrets Manager secret, fetched once. The
+    settings read it at import, so a rotated secret reaches the API only
+    after a restart. When "fallback_path" is set the fetched value is also
+    written there, a copy younger than "ttl" seconds saves the network round
+    trip on the next boot and an older one is used if Secrets Manager can't
+    be reached.
+    """
+
+    def __init__(self, secret_id, region_name='us-east-1', ttl=300, fallback_path=None):
+        self.secret_id = secret_id
+        self.region_name = region_name
+        self.ttl = ttl
+        self.fallback_path = fallback_path
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    value, age = self._read_fallback()
+                    if value is None or age >= self.ttl:
+                        value = self._load(fallback=value)
+                    self._value = value
+        return self._value
+
+    def _load(self, fallback=None):
+        try:
+            value = self._fetch()
+        except Exception:
+            if fallback is None:
+                raise
+            logger.exception("No se pudo leer el secreto %s, se usa la copia en disco", self.secret_id)
+            return fallback
+        self._write_fallback(value)
+        return value
+
+    def _fetch(self):
+        client = get_client('secretsmanager', self.region_name)
+        response = client.get_secret_value(SecretId=self.secret_id)
+        secret = response.get("SecretString", None)
+        if not secret:
+            raise ValueError("No hay datos o no tienen el formato correcto")
+        return json.loads(secret)
+
+    def _read_fallback(self):
+        if not self.fallback_path:
+            return None, None
+        try:
+            with open(self.fallback_path) as f:
+                value = json.load(f)
+            age = time.time() - os.path.getmtime(self.fallback_path)
+        except (OSError, ValueError):
+            return None, None
+        return value, age
+
+    def _write_fallback(self, value):
+        if not self.fallback_path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.fallback_path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(value, f)
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.fallback_path)
+        except OSError:
+            logger.exception("No se pudo guardar el secreto en %s", self.fallback_path)
+
+
+secrets_cache = SecretsCache(
+    'creze',
+    ttl=int(os.getenv('SECRETS_TTL', 300)),
+    fallback_path=os.getenv('SECRETS_CACHE_FILE'),
+)
@@ -1,7 +1,10 @@
 import re
+from collections.abc import Mapping
 
 from django.forms import ValidationError
 from rest_framework import serializers
+from rest_framework.fields import empty, get_error_detail
+from rest_framework.settings import api_settings
 
 
 class CustomCharField(serializers.CharField):
@@ -12,17 +15,21 @@ class CustomCharField(serializers.CharField):
     will be executed to the value.
     """
 
+    accepted_methods = ["capitalize", "lower", "title", "upper"]
+
     def __init__(self, **kwargs):
         self.str_method = kwargs.pop("str_method", None)
         self.validate_regex = kwargs.pop("validate_regex", None)
         super().__init__(**kwargs)
 
+        self.str_function = None
         if self.str_method is not None:
-            accepted_methods = ["capitalize", "lower", "title", "upper"]
-            if self.str_method not in accepted_methods:
+            if self.str_method not in self.accepted_methods:
                 message = f'El parámetro "{self.str_method}" no es válido.'
                 raise Exception(message)
+            self.str_function = getattr(str, self.str_method)
 
+        self.regex = None
         if self.validate_regex is not None:
             if not isinstance(self.validate_regex, dict):
                 message = "El parámetro 'validate_regex' debe de ser un diccionario."
@@ -32,19 +39,82 @@ class CustomCharField(serializers.CharField):
                 message = "La llave 'regex' no existe."
                 raise Exception(message)
 
+            default_error_message = "El campo no tiene un formato correcto"
+            self.regex = re.compile(self.validate_regex["regex"])
+            self.regex_error_message = self.validate_regex.get("error_message", default_error_message)
+
+    def run_validation(self, data=empty):
+        # After CharField turned numbers into str, {"code": 12345} is checked too.
+        value = super().run_validation(data)
+        if isinstance(value, str):
+            if self.str_function is not None:
+                value = self.str_function(value)
+
+            if self.regex is not None and not self.regex.match(value):
+                raise ValidationError(self.regex_error_message)
+
+        return value
+
+
+class FastSerializer:
+    """
+    Lightweight replacement of serializers.Serializer for small payloads with
+    a fixed shape. The declared fields are bound once per class instead of
+    being deep copied on every instance and "is_valid" only runs each field's
+    "run_validation", there are no nested, "validate_<field>" or object level
+    validations. Errors have the same format as DRF's.
+    """
+
+    _declared_fields = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._declared_fields = {}
+        for base in reversed(cls.__mro__):
+            for name, value in vars(base).items():
+                if isinstance(value, serializers.Field):
+                    cls._declared_fields[name] = value
+        for name, field in cls._declared_fields.items():
+            if field.field_name is None:
+                field.bind(name, None)
+
+    def __init__(self, data=empty):
+        self.initial_data = data
+
+    def is_valid(self, raise_exception=False):
+        if not hasattr(self, '_errors'):
+            self._validated_data, self._errors = self.run_validation(self.initial_data)
+
+        if self._errors and raise_exception:
+            raise serializers.ValidationError(self._errors)
+        return not self._errors
+
     def run_validation(self, data):
-        if isinstance(data, str):
-            if not self.required:
-                if self.str_method is not None:
-                    do_something = getattr(str, self.str_method)
-                    data = do_something(data)
+        if not isinstance(data, Mapping):
+            message = serializers.Serializer.default_error_messages['invalid'].format(
+                datatype=type(data).__name__
+            )
+            return {}, {api_settings.NON_FIELD_ERRORS_KEY: [message]}
 
-                if self.validate_regex is not None:
-                    default_error_message = "El campo no tiene un formato correcto"
-                    regex = self.validate_regex.get("regex")
-                    error_message = self.validate_regex.get("error_message", default_error_message)
+        validated_data = {}
+        errors = {}
+        for name, field in self._declared_fields.items():
+            try:
+                value = field.run_validation(field.get_value(data))
+            except serializers.ValidationError as exc:
+                errors[name] = exc.detail
+            except ValidationError as exc:
+                errors[name] = get_error_detail(exc)
+            except serializers.SkipField:
+                pass
+            else:
+                validated_data[name] = value
+        return validated_data, errors
 
-                    if not re.match(regex, data):
-                        raise ValidationError(error_message)
+    @property
+    def validated_data(self):
+        return self._validated_data
 
-        return super().run_validation(data)
+    @property
+    def errors(self):
+        return self._errors
@@ -0,0 +1,69 @@
+import os
+import threading
+
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from .pool import ConnectionPool
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_metrics():
+    pid = os.getpid()
+    return {alias: pool.metrics() for (alias, pool_pid), pool in _pools.items() if pool_pid == pid}
+
+
+def _ping(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+    return True
+
+
+def _reset(connection):
+    if connection.info.transaction_status != base.Database.extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend that borrows its connections from an in-process pool
+    instead of opening one per request. Configure it with the "POOL" key of
+    the database settings (MIN_SIZE, MAX_SIZE, TIMEOUT, CHECK_AFTER) and
+    CONN_MAX_AGE = 0, so Django hands the connection back after each request.
+    """
+
+    def get_pool(self, conn_params=None):
+        key = (self.alias, os.getpid())
+        pool = _pools.get(key)
+        if pool is None:
+            with _pools_lock:
+                pool = _pools.get(key)
+                if pool is None:
+                    if conn_params is None:
+                        conn_params = self.get_connection_params()
+                    config = self.settings_dict.get('POOL', {})
+                    pool = ConnectionPool(
+                        lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+                        min_size=config.get('MIN_SIZE', 1),
+                        max_size=config.get('MAX_SIZE', 10),
+                        timeout=config.get('TIMEOUT', 5),
+                        check=_ping,
+                        check_after=config.get('CHECK_AFTER', 30),
+                        reset=_reset,
+                    )
+                    _pools[key] = pool
+        return pool
+
+    def get_new_connection(self, conn_params):
+        options = self.settings_dict["OPTIONS"]
+        self.isolation_level = IsolationLevel(
+            options.get("isolation_level", IsolationLevel.READ_COMMITTED)
+        )
+        return self.get_pool(conn_params).acquire()
+
+    def _close(self):
+        if self.connection is not None:
+            discard = self.errors_occurred and not self.is_usable()
+            with self.wrap_database_errors:
+                self.get_pool().release(self.connection, discard=discard)
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of DB-API connections. It keeps at least "min_size"
+    and at most "max_size" connections open, "acquire" waits up to
+    "timeout" seconds for a free one and connections idle for longer than
+    "check_after" seconds are verified with "check" before being reused.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=5,
+                 check=None, check_after=30, reset=None):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self._check = check
+        self.check_after = check_after
+        self._reset = reset
+        self._idle = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self.stats = {
+            'acquired': 0,
+            'created': 0,
+            'discarded': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_seconds': 0.0,
+        }
+        for _ in range(min_size):
+            self._idle.append((self._create(), time.monotonic()))
+            self._size += 1
+
+    def _create(self):
+        connection = self._connect()
+        self.stats['created'] += 1
+        return connection
+
+    def _is_usable(self, connection, idle_since):
+        if getattr(connection, 'closed', False):
+            return False
+        if self._check is None or time.monotonic() - idle_since < self.check_after:
+            return True
+        try:
+            return self._check(connection)
+        except Exception:
+            return False
+
+    def _discard(self, connection):
+        self.stats['discarded'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        while True:
+            with self._cond:
+                connection = None
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f'No hay conexiones disponibles después de {self.timeout}s'
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    connection, idle_since = self._idle.pop()
+                else:
+                    self._size += 1
+            if connection is None:
+                break
+
+            # Checked without the lock, a slow ping must not stall the other threads.
+            if self._is_usable(connection, idle_since):
+                with self._cond:
+                    self._acquired(start, waited)
+                return connection
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            self._discard(connection)
+
+        try:
+            connection = self._create()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._acquired(start, waited)
+        return connection
+
+    def _acquired(self, start, waited):
+        self.stats['acquired'] += 1
+        if waited:
+            self.stats['waits'] += 1
+            self.stats['wait_seconds'] += time.monotonic() - start
+
+    def release(self, connection, discard=False):
+        if not discard and self._reset is not None:
+            try:
+                self._reset(connection)
+            except Exception:
+                discard = True
+
+        with self._cond:
+            if discard or getattr(connection, 'closed', False):
+                self._size -= 1
+                self._discard(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            while self._idle:
+                connection, _ = self._idle.pop()
+                self._size -= 1
+                self._discard(connection)
+
+    def metrics(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                **self.stats,
+            }
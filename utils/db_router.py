@@ -0,0 +1,135 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Seconds the replica is behind the primary, 0 when it replayed everything it
+# received (an idle primary doesn't make it lag) and NULL when it's unknown.
+LAG_QUERIES = {
+    'postgresql': (
+        "SELECT CASE WHEN NOT pg_is_in_recovery() "
+        "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+    ),
+}
+
+# Set once the request writes, the rest of its reads go to the primary.
+_pinned = contextvars.ContextVar('db_pinned', default=False)
+
+
+class Replicas:
+    """
+    Health of the settings.DATABASE_REPLICAS of this process. A replica is
+    used while its lag is at most REPLICA_MAX_LAG seconds, the lag is
+    measured again every REPLICA_CHECK_INTERVAL seconds and a replica that
+    can't be reached counts as lagging. Vendors without a lag query (SQLite)
+    are only checked to answer.
+
+    pin(key) sends the reads of "key" (e.g. a user) to the primary in every
+    worker for REPLICA_PIN_SECONDS, so whoever changed a row reads it back.
+    """
+
+    def __init__(self):
+        self._checks = {}
+        self._lock = threading.Lock()
+
+    def choose(self):
+        healthy = [alias for alias in settings.DATABASE_REPLICAS if self.healthy(alias)]
+        return random.choice(healthy) if healthy else None
+
+    def healthy(self, alias):
+        checked_at, healthy = self._checks.get(alias, (None, False))
+        now = time.monotonic()
+        if checked_at is not None and now - checked_at < settings.REPLICA_CHECK_INTERVAL:
+            return healthy
+        # Only one thread measures, the others keep the last result meanwhile.
+        if not self._lock.acquire(blocking=checked_at is None):
+            return healthy
+        try:
+            lag = self.lag(alias)
+            was_healthy, healthy = healthy, lag is not None and lag <= settings.REPLICA_MAX_LAG
+            if was_healthy != healthy or checked_at is None:
+                log = logger.info if healthy else logger.warning
+                log('Replica %s lag %s, %s', alias, lag, 'in use' if healthy else 'reads go to primary')
+            self._checks[alias] = (now, healthy)
+        finally:
+            self._lock.release()
+        return healthy
+
+    def lag(self, alias):
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_QUERIES.get(connection.vendor, 'SELECT 0'))
+                lag = cursor.fetchone()[0]
+        except DatabaseError:
+            logger.exception('Lag check of replica %s failed', alias)
+            return None
+        return None if lag is None else float(lag)
+
+    @staticmethod
+    def pin_key(key):
+        return f'db-pin:{key}'
+
+    def pin(self, key):
+        if settings.DATABASE_REPLICAS:
+            cache.set(self.pin_key(key), True, settings.REPLICA_PIN_SECONDS)
+
+    def pinned(self, key):
+        return bool(settings.DATABASE_REPLICAS) and cache.get(self.pin_key(key), False)
+
+    async def apinned(self, key):
+        return bool(settings.DATABASE_REPLICAS) and await cache.aget(self.pin_key(key), False)
+
+    def clear(self):
+        self._checks.clear()
+
+
+replicas = Replicas()
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of the users app to a healthy replica and everything
+    else, writes and the reads of a request that already wrote or that run
+    inside a transaction to the primary. With no healthy replica Django
+    falls back to the primary.
+    """
+
+    route_app_labels = {'users'}
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in self.route_app_labels or not settings.DATABASE_REPLICAS:
+            return None
+        if _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return replicas.choose()
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+@receiver(request_started)
+def unpin_request(**kwargs):
+    _pinned.set(False)
@@ -0,0 +1,174 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from utils.aws import get_client
+
+logger = logging.getLogger(__name__)
+
+
+class LambdaBackend:
+
+    def __init__(self, function_name='send_email_creze', region_name='us-east-1'):
+        self.function_name = function_name
+        self.client = get_client('lambda', region_name)
+
+    def send_messages(self, messages):
+        failed = []
+        for message in messages:
+            try:
+                self.client.invoke(
+                    FunctionName=self.function_name,
+                    InvocationType='Event',
+                    Payload=json.dumps(message)
+                )
+            except Exception as e:
+                logger.warning("Error al consumir lambda: %s", e)
+                failed.append(message)
+        return failed
+
+
+class InMemoryBackend:
+
+    # Only the last messages, a dev server running for days must not keep them all.
+    sent = deque(maxlen=1000)
+
+    def __init__(self, **kwargs):
+        pass
+
+    def send_messages(self, messages):
+        InMemoryBackend.sent.extend(messages)
+        return []
+
+
+class EmailOutbox:
+    """
+    In-process queue for outgoing emails. "enqueue" only puts the message on
+    a bounded queue, a daemon thread owns the backend (and therefore a single
+    boto3 client), drains the queue in batches of "batch_size" and retries
+    failed messages with exponential backoff.
+    """
+
+    def __init__(self, backend, options=None, max_size=1000, batch_size=10,
+                 max_retries=3, retry_backoff=0.5, shutdown_timeout=5):
+        self.backend_class = import_string(backend) if isinstance(backend, str) else backend
+        self.options = options or {}
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.shutdown_timeout = shutdown_timeout
+        self.queue = queue.Queue(max_size)
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def enqueue(self, message):
+        self._ensure_dispatcher()
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+            logger.error("La cola de correos está llena, se descarta el mensaje")
+            return False
+        return True
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def stats(self):
+        return {
+            'depth': self.depth(),
+            'sent': self.sent,
+            'failed': self.failed,
+            'dropped': self.dropped,
+        }
+
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _ensure_dispatcher(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                thread = threading.Thread(
+                    target=self._run, name='email-outbox', daemon=True
+                )
+                thread.start()
+                atexit.register(self.flush, self.shutdown_timeout)
+                self._pid = os.getpid()
+
+    def _run(self):
+        backend = None
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                if backend is None:
+                    backend = self.backend_class(**self.options)
+                self._send(backend, batch)
+            except Exception:
+                self.failed += len(batch)
+                logger.exception("Error al enviar correos")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _send(self, backend, messages):
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            try:
+                failed = backend.send_messages(messages)
+            except Exception as e:
+                logger.warning("Error al enviar correos: %s", e)
+                failed = messages
+            self.sent += len(messages) - len(failed)
+            if not failed:
+                return
+            messages = failed
+
+        self.failed += len(messages)
+        logger.error("No se pudieron enviar %s correos", len(messages))
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                config = settings.EMAIL_OUTBOX
+                _outbox = EmailOutbox(
+                    config['BACKEND'],
+                    options=config.get('OPTIONS'),
+                    max_size=config.get('MAX_SIZE', 1000),
+                    batch_size=config.get('BATCH_SIZE', 10),
+                    max_retries=config.get('MAX_RETRIES', 3),
+                    retry_backoff=config.get('RETRY_BACKOFF', 0.5),
+                )
+    return _outbox
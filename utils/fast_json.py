@@ -0,0 +1,90 @@
+import math
+from decimal import Decimal
+
+from rest_framework import parsers, renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _has_non_finite(data):
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, Decimal):
+        return not data.is_finite()
+    if isinstance(data, dict):
+        data = data.values()
+    elif not isinstance(data, (list, tuple)):
+        return False
+    return any(_has_non_finite(item) for item in data)
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer that serializes with orjson, or with one stdlib encoder
+    built once instead of one per response when orjson isn't installed.
+    Types orjson doesn't know (lazy strings, Decimal) and datetimes go
+    through DRF's encoder, so the output is the same as JSONRenderer's.
+    Int dict keys (ListField/DictField errors) are written as strings like
+    json does, payloads orjson rejects are rendered by JSONRenderer. orjson
+    writes NaN and Infinity as null, those payloads go to JSONRenderer too
+    so they still raise ValueError.
+    Indented responses (browsable API, "; indent=") use JSONRenderer.
+    """
+
+    def __init__(self):
+        self.encoder = self.encoder_class(
+            ensure_ascii=self.ensure_ascii, allow_nan=not self.strict,
+            separators=renderers.SHORT_SEPARATORS if self.compact else renderers.LONG_SEPARATORS,
+        )
+        self.orjson = orjson is not None and self.compact and not self.ensure_ascii
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if self.orjson:
+            try:
+                ret = orjson.dumps(
+                    data, default=self.encoder.default,
+                    option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+                )
+            except TypeError:
+                # Ints over 64 bits or keys orjson can't write, JSONRenderer can.
+                return super().render(data, accepted_media_type, renderer_context)
+            # Only looked for when there's a null, most responses have none.
+            if self.strict and b'null' in ret and _has_non_finite(data):
+                return super().render(data, accepted_media_type, renderer_context)
+        else:
+            ret = self.encoder.encode(data).encode()
+        # Same \u2028/\u2029 escaping as JSONRenderer, JSON stays a JavaScript subset.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(parsers.JSONParser):
+    """
+    JSONParser that reads the body in one go and decodes it with orjson
+    (UTF-8 bodies) or json.loads, instead of through a codecs stream reader.
+    """
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        body = stream.read()
+        try:
+            if orjson is not None and encoding.lower().replace('-', '') == 'utf8':
+                return orjson.loads(body)
+            parse_constant = json.strict_constant if self.strict else None
+            return json.loads(body.decode(encoding), parse_constant=parse_constant)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
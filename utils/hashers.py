@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+def cost(algorithm, name):
+    """Cost parameter read from PASSWORD_HASHER_COST on every use."""
+    return property(lambda self: settings.PASSWORD_HASHER_COST[algorithm][name])
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    work_factor = cost('scrypt', 'work_factor')
+    block_size = cost('scrypt', 'block_size')
+    parallelism = cost('scrypt', 'parallelism')
+    # Upper bound for OpenSSL, not an allocation. Its 32MiB default rejects
+    # work factors from 2 ** 15 on.
+    maxmem = 2 ** 30
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    time_cost = cost('argon2', 'time_cost')
+    memory_cost = cost('argon2', 'memory_cost')
+    parallelism = cost('argon2', 'parallelism')
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    iterations = cost('pbkdf2_sha256', 'iterations')
+
@@ -0,0 +1,309 @@
+import asyncio
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model, hashers
+from django.db import close_old_connections
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from utils.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+class HashingPoolBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'El servicio está saturado, intenta más tarde'
+    default_code = 'hashing_pool_busy'
+
+
+class HashingPool:
+    """
+    Runs the password hashers in a process pool so PBKDF2 does not hold the
+    gunicorn worker. At most "max_pending" hashes may be queued or running at
+    once, any request beyond that gets a 503 instead of waiting. Async
+    callers, many per worker under uvicorn, wait up to "timeout" for a slot
+    instead. A hash that outlives "timeout" keeps its slot until it ends. The
+    processes come from a forkserver, not a fork of the threaded worker. With
+    "max_workers" set to 0 the hashes are computed inline.
+    """
+
+    def __init__(self, max_workers=None, max_pending=None, timeout=None):
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        self.max_workers = max_workers
+        self.max_pending = max_pending or max_workers * 2
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._slots = None
+        self._async_slots = weakref.WeakKeyDictionary()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = None
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+                self._pid = os.getpid()
+            if self._executor is None:
+                # Forking a worker that already runs threads (gthread, the
+                # outbox, the upgrader) may copy locks held by them.
+                self._executor = ProcessPoolExecutor(
+                    self.max_workers, mp_context=multiprocessing.get_context('forkserver'),
+                    initializer=django.setup,
+                )
+            return self._executor, self._slots
+
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def run(self, fn, *args):
+        return self.run_many(fn, [args])[0]
+
+    async def arun(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        if not self.max_workers:
+            return await loop.run_in_executor(None, fn, *args)
+
+        executor, slots = self._get_executor()
+        waiting = self._async_slots.get(loop)
+        if waiting is None:
+            waiting = self._async_slots[loop] = asyncio.Semaphore(self.max_pending)
+        deadline = loop.time() + (self.timeout or 0)
+        try:
+            await asyncio.wait_for(waiting.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise HashingPoolBusy()
+        # The sync callers (password upgrades) share the pool's slots.
+        if not slots.acquire(blocking=False):
+            waiting.release()
+            raise HashingPoolBusy()
+
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            slots.release()
+            waiting.release()
+            self._discard(executor)
+            raise HashingPoolBusy()
+        # Both slots are freed when the hash ends, not when the caller gives up.
+        future.add_done_callback(lambda _: slots.release())
+        future = asyncio.wrap_future(future)
+        future.add_done_callback(lambda done: _release(waiting, done))
+        try:
+            timeout = max(0, deadline - loop.time()) if self.timeout else None
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            raise HashingPoolBusy()
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise HashingPoolBusy()
+
+    def run_many(self, fn, args_list):
+        """Runs fn once per args in parallel, all of them get a slot or none does."""
+        if not self.max_workers:
+            return [fn(*args) for args in args_list]
+
+        executor, slots = self._get_executor()
+        deadline = time.monotonic() + (self.timeout or 0)
+        acquired = 0
+        futures = []
+        try:
+            for _ in args_list:
+                if not slots.acquire(blocking=False):
+                    raise HashingPoolBusy()
+                acquired += 1
+            for args in args_list:
+                future = executor.submit(fn, *args)
+                # The slot is freed when the hash ends, not when the caller gives up.
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+            # One deadline for the whole batch, not one timeout per hash.
+            return [
+                future.result(timeout=max(0, deadline - time.monotonic()) if self.timeout else None)
+                for future in futures
+            ]
+        except TimeoutError:
+            raise HashingPoolBusy()
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise HashingPoolBusy()
+        finally:
+            for _ in range(acquired - len(futures)):
+                slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _release(semaphore, future):
+    if not future.cancelled():
+        # Retrieved so an abandoned hash that failed doesn't log a warning.
+        future.exception()
+    semaphore.release()
+
+
+hashing_pool = HashingPool(
+    settings.HASHING_POOL_WORKERS,
+    settings.HASHING_POOL_MAX_PENDING,
+    settings.HASHING_POOL_TIMEOUT,
+)
+
+
+def make_password(password):
+    with timed('hashing'):
+        return hashing_pool.run(hashers.make_password, password)
+
+
+def check_password(password, encoded):
+    with timed('hashing'):
+        return hashing_pool.run(hashers.check_password, password, encoded)
+
+
+_hash_seconds = {}
+
+
+def _hash_key():
+    return settings.PASSWORD_HASHER, repr(settings.PASSWORD_HASHER_COST[settings.PASSWORD_HASHER])
+
+
+def _time_hash():
+    start = time.perf_counter()
+    hashers.make_password('calibration-password')
+    return time.perf_counter() - start
+
+
+def hash_seconds():
+    """
+    Seconds one hash with the preferred hasher takes, PASSWORD_HASH_MS from
+    calibrate_hasher or else measured once per process and cost, in the
+    hashing pool like any other hash.
+    """
+    if settings.PASSWORD_HASH_MS:
+        return settings.PASSWORD_HASH_MS / 1000
+    key = _hash_key()
+    if key not in _hash_seconds:
+        _hash_seconds[key] = hashing_pool.run(_time_hash)
+    return _hash_seconds[key]
+
+
+def measure_hash_seconds():
+    """Measures hash_seconds() inline, for the gunicorn master before the fork."""
+    if not settings.PASSWORD_HASH_MS:
+        _hash_seconds[_hash_key()] = _time_hash()
+
+
+def max_batch_size():
+    """
+    Passwords make_passwords() hashes in half of the pool timeout, a bulk
+    signup within it neither times out nor holds the pool for long.
+    """
+    budget = (hashing_pool.timeout or settings.HASHING_POOL_TIMEOUT) / 2
+    size = int(budget * (hashing_pool.max_workers or 1) / hash_seconds())
+    return max(1, min(settings.SIGNUP_BULK_MAX_SIZE, size))
+
+
+def make_passwords(passwords):
+    """
+    Hashes a list of passwords, one per pool process at a time, so a login
+    submitted meanwhile waits for one hash instead of the rest of the list.
+    """
+    step = hashing_pool.max_workers or len(passwords) or 1
+    encoded = []
+    with timed('hashing'):
+        for i in range(0, len(passwords), step):
+            encoded += hashing_pool.run_many(hashers.make_password, [(p,) for p in passwords[i:i + step]])
+    return encoded
+
+
+async def amake_password(password):
+    with timed('hashing'):
+        return await hashing_pool.arun(hashers.make_password, password)
+
+
+async def acheck_password(password, encoded):
+    with timed('hashing'):
+        return await hashing_pool.arun(hashers.check_password, password, encoded)
+
+
+def must_update(encoded):
+    preferred = hashers.get_hasher('default')
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+class PasswordUpgrader:
+    """
+    Rehashes, after a successful login, the passwords stored with an old
+    hasher or cost. A daemon thread computes the new hash and writes it only
+    if the stored one didn't change meanwhile, so the login response waits
+    for neither the second hash nor the UPDATE. Upgrades that find the queue
+    full or the hashing pool busy are skipped, the next login retries them.
+    """
+
+    def __init__(self, max_size=100, shutdown_timeout=5):
+        self.queue = queue.Queue(max_size)
+        self.shutdown_timeout = shutdown_timeout
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def enqueue(self, user_id, password, encoded):
+        self._ensure_worker()
+        try:
+            self.queue.put_nowait((user_id, password, encoded))
+        except queue.Full:
+            return False
+        return True
+
+    def upgrade(self, user_id, password, encoded):
+        user = get_user_model()(pk=user_id)
+        return user.transition({'password': encoded}, password=make_password(password))
+
+    def flush(self, timeout=None):
+        with self.queue.all_tasks_done:
+            return self.queue.all_tasks_done.wait_for(lambda: not self.queue.unfinished_tasks, timeout)
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                thread = threading.Thread(target=self._run, name='password-upgrader', daemon=True)
+                thread.start()
+                atexit.register(self.flush, self.shutdown_timeout)
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            user_id, password, encoded = self.queue.get()
+            try:
+                self.upgrade(user_id, password, encoded)
+            except HashingPoolBusy:
+                pass
+            except Exception:
+                logger.exception("Error al actualizar el hash de la contraseña")
+            finally:
+                close_old_connections()
+                self.queue.task_done()
+
+
+password_upgrader = PasswordUpgrader()
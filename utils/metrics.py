@@ -0,0 +1,264 @@
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Totals of the workers that already exited, see Registry.retire.
+RETIRED_FILE = 'retired.json'
+
+_phases = contextvars.ContextVar('metrics_phases', default=None)
+
+
+class Registry:
+    """
+    Counters and histograms of this process. They are periodically dumped
+    to "<METRICS_DIR>/<pid>.json" and the /metrics view adds up the files of
+    every worker, so the numbers cover the whole gunicorn server.
+    """
+
+    def __init__(self, directory, flush_interval=1):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._flushed_at = 0
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+            for index, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+                'histograms': [
+                    [name, labels, list(buckets), total, count]
+                    for (name, labels), (buckets, total, count) in self._histograms.items()
+                ],
+                'gauges': collect_gauges(),
+            }
+
+    def maybe_flush(self):
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._flushed_at = time.monotonic()
+        self._write(f'{os.getpid()}.json', self.snapshot())
+
+    def _write(self, filename, data):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, os.path.join(self.directory, filename))
+
+    def _read(self, filename):
+        try:
+            with open(os.path.join(self.directory, filename)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _merge(counters, histograms, data):
+        for name, labels, value in data['counters']:
+            counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, buckets, total, count in data['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [[0] * len(BUCKETS), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+
+    def collect(self):
+        self.flush()
+        counters = defaultdict(float)
+        histograms = {}
+        gauges = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            data = self._read(filename)
+            if data is None:
+                continue
+            self._merge(counters, histograms, data)
+            pid = filename[:-len('.json')]
+            for name, labels, value in data['gauges']:
+                gauges.append((name, tuple(map(tuple, labels)) + (('pid', pid),), value))
+        return counters, histograms, gauges
+
+    def retire(self, pid):
+        """
+        Run by the gunicorn master when a worker exits. Its counters and
+        histograms are added to "retired.json", so the totals never go
+        back, and its file and gauges are dropped.
+        """
+        filename = f'{pid}.json'
+        data = self._read(filename)
+        if data is not None:
+            counters = defaultdict(float)
+            histograms = {}
+            retired = self._read(RETIRED_FILE)
+            if retired is not None:
+                self._merge(counters, histograms, retired)
+            self._merge(counters, histograms, data)
+            self._write(RETIRED_FILE, {
+                'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+                'histograms': [
+                    [name, labels, buckets, total, count]
+                    for (name, labels), (buckets, total, count) in histograms.items()
+                ],
+                'gauges': [],
+            })
+        try:
+            os.remove(os.path.join(self.directory, filename))
+        except FileNotFoundError:
+            pass
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def render(counters, histograms, gauges):
+    lines = []
+    for (name, labels), value in sorted(counters.items()):
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+    for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+        for bound, bucket in zip(BUCKETS, buckets):
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {bucket}')
+        lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {count}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+        lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    for name, labels, value in sorted(gauges):
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def collect_gauges():
+    from utils import email_outbox
+    from utils.db_pool.base import pool_metrics
+
+    gauges = []
+    if email_outbox._outbox is not None:
+        gauges.append(['email_outbox_depth', [], email_outbox._outbox.depth()])
+    for alias, metrics in pool_metrics().items():
+        for key in ('size', 'idle', 'in_use', 'waits', 'timeouts'):
+            gauges.append([f'db_pool_{key}', [['alias', alias]], metrics[key]])
+    return gauges
+
+
+registry = Registry(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)
+
+
+@contextmanager
+def timed(phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases = _phases.get()
+        if phases is not None:
+            phases[phase] += time.perf_counter() - start
+
+
+def _db_timer(execute, sql, params, many, context):
+    phases = _phases.get()
+    if phases is None:
+        return execute(sql, params, many, context)
+    phases['db_queries'] += 1
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+def install_db_timer(connection, **kwargs):
+    if _db_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_timer)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency of every request per view, plus how much of it was
+    spent in the DB, password hashing, Fernet and TOTP (see "timed").
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        connection_created.connect(install_db_timer)
+        for connection in connections.all(initialized_only=True):
+            install_db_timer(connection)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = _phases.set(defaultdict(float))
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            self.record(request, response, time.perf_counter() - start)
+        finally:
+            _phases.reset(token)
+        return response
+
+    async def __acall__(self, request):
+        token = _phases.set(defaultdict(float))
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            self.record(request, response, time.perf_counter() - start)
+        finally:
+            _phases.reset(token)
+        return response
+
+    def record(self, request, response, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        phases = _phases.get()
+        registry.observe(
+            'http_request_duration_seconds', elapsed, view=view,
+            method=request.method, status=f'{response.status_code // 100}xx'
+        )
+        registry.inc('db_queries_total', phases.pop('db_queries', 0), view=view)
+        registry.inc('http_requests_total', view=view)
+        for phase, seconds in phases.items():
+            registry.observe('http_request_phase_seconds', seconds, view=view, phase=phase)
+        registry.maybe_flush()
+
+
+def metrics_view(request):
+    content = render(*registry.collect())
+    return HttpResponse(content, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,27 @@
+from django.db import connections
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the tests with a LocMemCache of their own, cache.clear() in a test
+    must not wipe the cache directory of a dev server running next to it.
+    Without replicas configured it adds a "replica_1" mirror of "default" for
+    the router tests, which route to it with override_settings.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_settings = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        )
+        self.cache_settings.enable()
+        if 'replica_1' not in connections:
+            default = connections.settings['default']
+            databases = {'default': default, 'replica_1': default | {'TEST': {'MIRROR': 'default'}}}
+            connections.settings['replica_1'] = connections.configure_settings(databases)['replica_1']
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_settings.disable()
+        super().teardown_test_environment(**kwargs)
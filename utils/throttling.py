@@ -0,0 +1,67 @@
+from rest_framework import throttling
+
+
+class SlidingWindowRateThrottle(throttling.SimpleRateThrottle):
+    """
+    Sliding window counter version of DRF's SimpleRateThrottle. Instead of
+    the list of request timestamps it keeps one integer per fixed window and
+    estimates the requests in the last "duration" seconds as the current
+    counter plus the previous one weighted by how much of it still overlaps.
+    Each check is one get_many and one add/incr on the shared cache.
+    """
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        now = self.timer()
+        window = int(now // self.duration)
+        elapsed = now - window * self.duration
+        current_key = f'{self.key}:{window}'
+        previous_key = f'{self.key}:{window - 1}'
+
+        counts = self.cache.get_many([current_key, previous_key])
+        current = counts.get(current_key, 0)
+        previous = counts.get(previous_key, 0)
+        weight = (self.duration - elapsed) / self.duration
+
+        if current + previous * weight >= self.num_requests:
+            self.wait_seconds = self.get_wait(current, previous, elapsed)
+            return False
+
+        self.incr(current_key)
+        return True
+
+    def incr(self, key):
+        timeout = self.duration * 2
+        if self.cache.add(key, 1, timeout):
+            return
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, timeout)
+
+    def get_wait(self, current, previous, elapsed):
+        if current >= self.num_requests or not previous:
+            return self.duration - elapsed
+        overlap = (self.num_requests - current) / previous
+        return max(0, self.duration * (1 - overlap) - elapsed)
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, SlidingWindowRateThrottle):
+    pass
+
+
+class UserRateThrottle(throttling.UserRateThrottle, SlidingWindowRateThrottle):
+    pass
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle, SlidingWindowRateThrottle):
+    pass